@@ -0,0 +1,49 @@
+"""
+Benchmark del detector de anomalías del consumer.
+Usar: python3 benchmarks/bench_anomalias.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'consumer'))
+
+from consumer_anomalias import DetectorAnomalias
+
+LECTURAS = 200_000
+ESTACIONES = 50
+TAMANOS_LOTE = [1, 5, 10, 20, 32, 50, 200, 1000]
+
+
+def generar_lecturas(n, estaciones, semilla=42):
+    rng = np.random.default_rng(semilla)
+    ids = rng.integers(1, estaciones + 1, n)
+    temperaturas = np.round(rng.uniform(15, 35, n), 2)
+    humedades = np.round(rng.uniform(40, 90, n), 2)
+    return ids, temperaturas, humedades
+
+
+def medir(tamano_lote, ids, temperaturas, humedades, **opciones):
+    detector = DetectorAnomalias(**opciones)
+    n = ids.shape[0]
+    t0 = time.perf_counter()
+    for inicio in range(0, n, tamano_lote):
+        fin = inicio + tamano_lote
+        detector.evaluar(ids[inicio:fin], temperaturas[inicio:fin], humedades[inicio:fin])
+    return (time.perf_counter() - t0) / n
+
+
+if __name__ == "__main__":
+    ids, temperaturas, humedades = generar_lecturas(LECTURAS, ESTACIONES)
+    print(f"{LECTURAS} lecturas, {ESTACIONES} estaciones")
+    for tamano in TAMANOS_LOTE:
+        por_lectura = medir(tamano, ids, temperaturas, humedades)
+        # lote_escalar=0: siempre NumPy, para ver dónde se cruzan los caminos
+        solo_numpy = medir(tamano, ids, temperaturas, humedades, lote_escalar=0)
+        print(
+            f"lote={tamano:>5} | {por_lectura * 1e6:8.2f} µs/lectura"
+            f" | solo NumPy {solo_numpy * 1e6:8.2f} µs/lectura"
+        )
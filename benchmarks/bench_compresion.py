@@ -0,0 +1,78 @@
+"""
+Benchmark de compresión de payloads: bytes/msg y CPU/msg (compresión en el
+producer + descompresión en el consumer) para cada configuración.
+
+Usar: python3 benchmarks/bench_compresion.py
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'producer'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'consumer'))
+
+from consumer_compresion import descomprimir
+from producer_compresion import comprimir, zstandard
+
+MENSAJES = 20_000
+MINIMO_BYTES = 64
+
+
+def generar_cuerpos(n, semilla=42):
+    rng = random.Random(semilla)
+    return [
+        json.dumps({
+            "estacion_id": rng.randint(1, 5),
+            "temperatura": round(rng.uniform(15, 35), 2),
+            "humedad": round(rng.uniform(40, 90), 2),
+            "fecha": f"2026-10-19T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+                     f"{rng.randint(0, 59):02d}.{rng.randint(0, 999999):06d}",
+        }).encode()
+        for _ in range(n)
+    ]
+
+
+def medir(cuerpos, comprimir_fn, descomprimir_fn):
+    t0 = time.perf_counter()
+    comprimidos = [comprimir_fn(body) for body in cuerpos]
+    t_comp = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for body, encoding in comprimidos:
+        descomprimir_fn(body, encoding)
+    t_desc = time.perf_counter() - t0
+
+    n = len(cuerpos)
+    bytes_msg = sum(len(body) for body, _ in comprimidos) / n
+    return bytes_msg, t_comp / n, t_desc / n
+
+
+if __name__ == "__main__":
+    cuerpos = generar_cuerpos(MENSAJES)
+    crudo = sum(len(body) for body in cuerpos) / len(cuerpos)
+
+    configuraciones = [
+        ("none", lambda b: comprimir(b, "none", MINIMO_BYTES), descomprimir),
+        # Referencia: zlib sin diccionario (no se publica así)
+        ("zlib sin dict", lambda b: (zlib.compress(b, 9), "zlib"),
+         lambda b, e: zlib.decompress(b)),
+        ("zlib-dict-v1", lambda b: comprimir(b, "zlib", MINIMO_BYTES), descomprimir),
+    ]
+    if zstandard is not None:
+        configuraciones.append(
+            ("zstd-dict-v1", lambda b: comprimir(b, "zstd", MINIMO_BYTES), descomprimir)
+        )
+    else:
+        print("zstandard no instalado: se omite zstd")
+
+    print(f"{MENSAJES} mensajes, {crudo:.1f} bytes/msg sin comprimir")
+    for nombre, comprimir_fn, descomprimir_fn in configuraciones:
+        bytes_msg, comp, desc = medir(cuerpos, comprimir_fn, descomprimir_fn)
+        print(
+            f"{nombre:<14} | {bytes_msg:6.1f} bytes/msg ({bytes_msg / crudo:5.1%}) | "
+            f"comprimir {comp * 1e6:5.2f} µs/msg | descomprimir {desc * 1e6:5.2f} µs/msg"
+        )
@@ -0,0 +1,101 @@
+"""
+Benchmark del camino por mensaje del consumer (sin broker ni BD):
+decodificación -> registro -> fila para el INSERT -> log.
+
+Compara el camino anterior (dict retenido + f-string formateado siempre)
+con el actual (Lectura con __slots__ + log DEBUG muestreado), midiendo
+la memoria retenida por registro en el lote con tracemalloc y CPU por
+mensaje con perf_counter.
+
+Usar: python3 benchmarks/bench_hot_path.py
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'consumer'))
+
+from consumer_validacion import validar_mensaje
+
+MENSAJES = 100_000
+LOG_SAMPLE_EVERY = 1000
+
+logger = logging.getLogger("bench_hot_path")
+logger.addHandler(logging.NullHandler())
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+CUERPO = json.dumps({
+    "estacion_id": 3,
+    "temperatura": 22.5,
+    "humedad": 60.0,
+    "fecha": "2025-11-11T12:30:45.123456",
+}).encode()
+
+
+def camino_anterior(body, i):
+    data = json.loads(body)
+    if not all(key in data for key in ["estacion_id", "temperatura", "humedad", "fecha"]):
+        return None
+    logger.info(f"Insertado en BD: {data}")
+    return data
+
+
+def fila_anterior(data):
+    return (data["estacion_id"], data["temperatura"], data["humedad"], data["fecha"])
+
+
+def camino_actual(body, i):
+    lectura, error = validar_mensaje(body)
+    if error is not None:
+        return None
+    if i % LOG_SAMPLE_EVERY == 0 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Mensaje recibido (muestra 1/%d): %r", LOG_SAMPLE_EVERY, lectura)
+    return lectura
+
+
+def fila_actual(lectura):
+    return lectura.como_fila()
+
+
+def medir_cpu(camino, fila):
+    t0 = time.perf_counter()
+    for i in range(MENSAJES):
+        fila(camino(CUERPO, i))
+    return (time.perf_counter() - t0) / MENSAJES
+
+
+def medir_asignaciones(camino, muestras=10_000):
+    # Se conservan los registros como hace el lote hasta la escritura
+    retenidos = []
+    tracemalloc.start()
+    inicio = tracemalloc.take_snapshot()
+    for i in range(muestras):
+        retenidos.append(camino(CUERPO, i))
+    fin = tracemalloc.take_snapshot()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    diferencias = fin.compare_to(inicio, "filename")
+    bloques = sum(d.count_diff for d in diferencias)
+    memoria = sum(d.size_diff for d in diferencias)
+    return bloques / muestras, memoria / muestras, pico / muestras
+
+
+if __name__ == "__main__":
+    caminos = [
+        ("anterior", camino_anterior, fila_anterior),
+        ("actual", camino_actual, fila_actual),
+    ]
+    for nombre, camino, fila in caminos:
+        cpu = medir_cpu(camino, fila)
+        bloques, memoria, pico = medir_asignaciones(camino)
+        print(
+            f"{nombre:>9} | {cpu * 1e6:6.2f} µs/msg | "
+            f"{bloques:5.1f} bloques retenidos/msg | "
+            f"{memoria:6.1f} B retenidos/msg | {pico:6.1f} B pico/msg"
+        )
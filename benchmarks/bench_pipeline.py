@@ -0,0 +1,74 @@
+"""
+Benchmark del pipeline del consumer sin broker ni BD: un canal falso
+recibe los ack/nack y un sumidero nulo reemplaza a PostgreSQL, de modo que
+se mide solo decodificación + validación + etapas + bookkeeping del lote.
+
+Usar: python3 benchmarks/bench_pipeline.py
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'consumer'))
+
+from consumer_anomalias import EtapaAnomalias
+from consumer_core import Pipeline
+
+MENSAJES = 100_000
+
+
+class CanalNulo:
+    """Sustituye al canal de pika: solo cuenta confirmaciones."""
+
+    def __init__(self):
+        self.acks = 0
+        self.nacks = 0
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks += 1
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        self.nacks += 1
+
+
+def sumidero_nulo(lecturas, anomalias, resumenes):
+    return True
+
+
+def generar_cuerpos(n, semilla=42):
+    rng = random.Random(semilla)
+    return [
+        json.dumps({
+            "estacion_id": rng.randint(1, 5),
+            "temperatura": round(rng.uniform(15, 35), 2),
+            "humedad": round(rng.uniform(40, 90), 2),
+            "fecha": "2025-11-11T12:30:45.123456",
+        }).encode()
+        for _ in range(n)
+    ]
+
+
+def medir(pipeline, cuerpos):
+    canal = CanalNulo()
+    t0 = time.perf_counter()
+    for tag, body in enumerate(cuerpos, start=1):
+        pipeline.recibir(canal, tag, body)
+    pipeline.vaciar(canal)
+    return (time.perf_counter() - t0) / len(cuerpos)
+
+
+if __name__ == "__main__":
+    cuerpos = generar_cuerpos(MENSAJES)
+    configuraciones = [
+        ("lote=1, sin etapas", dict(tamano_lote=1)),
+        ("lote=50, sin etapas", dict(tamano_lote=50)),
+        ("lote=50, anomalías", dict(tamano_lote=50, etapas=[EtapaAnomalias()])),
+        ("lote=500, anomalías", dict(tamano_lote=500, etapas=[EtapaAnomalias()])),
+    ]
+    for nombre, kwargs in configuraciones:
+        pipeline = Pipeline(sumidero=sumidero_nulo, **kwargs)
+        por_mensaje = medir(pipeline, cuerpos)
+        print(f"{nombre:<22} | {por_mensaje * 1e6:6.2f} µs/msg")
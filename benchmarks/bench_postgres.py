@@ -0,0 +1,92 @@
+"""
+Benchmark de los sumideros de PostgreSQL: camino por sentencia
+(insertar_por_fila, lo que hacía insertar_weather_log) frente a sentencias
+preparadas + execute_batch, y frente a execute_values / COPY como
+referencia. Necesita una base con db/init.sql aplicado (POSTGRES_HOST,
+POSTGRES_DB, ...); las filas de prueba usan fechas del año 2000 y se
+borran al terminar cada configuración.
+
+Usar: POSTGRES_HOST=localhost python3 benchmarks/bench_postgres.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'consumer'))
+
+import consumer_bd
+from consumer_lectura import Lectura
+
+LECTURAS = 5_000
+LIMPIEZA = (
+    "DELETE FROM weather_logs WHERE fecha < '2000-01-02'",
+    "DELETE FROM weather_logs_anomalias WHERE fecha < '2000-01-02'",
+    "DELETE FROM weather_logs_rollup WHERE minuto < '2000-01-02'",
+)
+
+
+def generar_lecturas(n, semilla=42):
+    rng = random.Random(semilla)
+    return [
+        Lectura(
+            rng.randint(1, 5),
+            round(rng.uniform(15, 35), 2),
+            round(rng.uniform(40, 90), 2),
+            f"2000-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+        )
+        for i in range(n)
+    ]
+
+
+def limpiar():
+    conn = consumer_bd.validar_conexion()
+    cursor = conn.cursor()
+    for sentencia in LIMPIEZA:
+        cursor.execute(sentencia)
+    conn.commit()
+    cursor.close()
+
+
+def medir(sumidero, lecturas, tamano_lote):
+    # Cada 10 lecturas, una anomalía y un resumen, como con el límite activo
+    t0 = time.perf_counter()
+    for inicio in range(0, len(lecturas), tamano_lote):
+        lote = lecturas[inicio:inicio + tamano_lote]
+        anomalias = [(lectura, "pico") for lectura in lote[::10]]
+        # Como AgregadorExceso: una fila por (estación, minuto) en cada lote
+        resumenes = [
+            (estacion_id, "2000-01-01T00:00:00", 1, lectura.temperatura, lectura.humedad)
+            for estacion_id, lectura in {l.estacion_id: l for l in lote[5::10]}.items()
+        ]
+        if not sumidero(lote, anomalias, resumenes):
+            raise RuntimeError("el sumidero devolvió error")
+    elapsed = time.perf_counter() - t0
+    limpiar()
+    return elapsed / len(lecturas)
+
+
+if __name__ == "__main__":
+    lecturas = generar_lecturas(LECTURAS)
+    consumer_bd.conectar_postgres()
+    limpiar()
+
+    configuraciones = [
+        ("por sentencia, lote=1", consumer_bd.insertar_por_fila, 1),
+        ("preparado, lote=1", consumer_bd.insertar_preparado, 1),
+        ("por sentencia, lote=50", consumer_bd.insertar_por_fila, 50),
+        ("preparado, lote=50", consumer_bd.insertar_preparado, 50),
+        ("execute_values, lote=50", consumer_bd.insertar_lote, 50),
+        ("copy, lote=50", consumer_bd.copiar_lote, 50),
+    ]
+    print(f"{LECTURAS} lecturas en {consumer_bd.postgres_config['host']}")
+    base = {}
+    for nombre, sumidero, tamano_lote in configuraciones:
+        por_lectura = medir(sumidero, lecturas, tamano_lote)
+        base.setdefault(tamano_lote, por_lectura)
+        print(
+            f"{nombre:<24} | {por_lectura * 1e6:8.1f} µs/lectura | "
+            f"x{base[tamano_lote] / por_lectura:4.1f} vs por sentencia"
+        )
+    consumer_bd.cerrar_conexion()
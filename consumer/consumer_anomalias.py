@@ -0,0 +1,326 @@
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Códigos de anomalía (máscara de bits, una lectura puede tener varios)
+PICO = 1
+PLANO = 2
+ATASCADO = 4
+FUERA_RANGO = 8
+
+NOMBRES_ANOMALIA = {
+    PICO: "pico",
+    PLANO: "plano",
+    ATASCADO: "atascado",
+    FUERA_RANGO: "fuera_rango",
+}
+
+# Límites de los CHECK de weather_logs (db/init.sql)
+RANGO_TEMPERATURA = (-100.0, 100.0)
+RANGO_HUMEDAD = (0.0, 100.0)
+
+# Cota de b**-pos dentro de un trozo; mantiene acotado el error de la
+# suma acumulada en forma cerrada (ver _evaluar_trozo)
+PESO_MAXIMO = 1e6
+
+# Hasta este tamaño de lote el camino escalar (evaluar_lectura) es más
+# rápido que el NumPy: ~4-8 µs por lectura frente al costo fijo de
+# _evaluar_trozo, que a lote=8 aún da ~33 µs por lectura y se iguala
+# hacia lote=32 (medido con benchmarks/bench_anomalias.py)
+LOTE_ESCALAR_MAXIMO = 32
+
+
+def describir(codigo):
+    """Convierte una máscara de anomalía en texto, p. ej. 'pico,atascado'."""
+    return ",".join(
+        nombre for bit, nombre in NOMBRES_ANOMALIA.items() if codigo & bit
+    )
+
+
+class DetectorAnomalias:
+    """
+    Detector vectorizado de anomalías por estación.
+
+    Mantiene, para cada estación y cada variable (temperatura, humedad),
+    la media y varianza EWMA, el último valor y la racha de valores
+    idénticos. Cada estacion_id recibe una fila densa (_filas) la primera
+    vez que aparece: el estado crece con el número de estaciones, no con
+    el valor de su id. `evaluar` procesa un lote completo con operaciones NumPy,
+    sin bucles de Python por lectura (salvo lotes de hasta `lote_escalar`
+    lecturas, ver evaluar_lectura), y devuelve una máscara por lectura:
+
+    - PICO: |x - media| > umbral_pico * desviación (tras el calentamiento)
+    - PLANO: la varianza EWMA cayó por debajo de varianza_minima
+    - ATASCADO: el mismo valor exacto se repite repeticiones_atasco veces
+    - FUERA_RANGO: el valor viola los CHECK de weather_logs
+    """
+
+    def __init__(self, alpha=0.1, umbral_pico=4.0, varianza_minima=1e-4,
+                 repeticiones_atasco=5, calentamiento=10, capacidad=16,
+                 lote_escalar=LOTE_ESCALAR_MAXIMO):
+        self.alpha = alpha
+        self.umbral_pico = umbral_pico
+        self.varianza_minima = varianza_minima
+        self.repeticiones_atasco = repeticiones_atasco
+        self.calentamiento = calentamiento
+        self.lote_escalar = lote_escalar
+        self._tamano_trozo = max(8, int(np.log(PESO_MAXIMO) / -np.log1p(-alpha)))
+
+        # estacion_id -> fila de los arrays de estado
+        self._filas = {}
+        self._media = np.zeros((capacidad, 2))
+        self._varianza = np.zeros((capacidad, 2))
+        self._conteo = np.zeros(capacidad, dtype=np.int64)
+        self._ultimo = np.full((capacidad, 2), np.nan)
+        self._racha = np.zeros((capacidad, 2), dtype=np.int64)
+
+    def _asegurar_capacidad(self, filas):
+        capacidad = self._conteo.shape[0]
+        if filas <= capacidad:
+            return
+        nueva = max(filas, capacidad * 2)
+        extra = nueva - capacidad
+        self._media = np.concatenate([self._media, np.zeros((extra, 2))])
+        self._varianza = np.concatenate([self._varianza, np.zeros((extra, 2))])
+        self._conteo = np.concatenate([self._conteo, np.zeros(extra, dtype=np.int64)])
+        self._ultimo = np.concatenate([self._ultimo, np.full((extra, 2), np.nan)])
+        self._racha = np.concatenate([self._racha, np.zeros((extra, 2), dtype=np.int64)])
+
+    def evaluar(self, estaciones, temperaturas, humedades):
+        """
+        Evalúa un lote de lecturas y actualiza el estado por estación.
+
+        Devuelve un np.ndarray de enteros (máscara de anomalías) alineado
+        con el orden de entrada. 0 significa lectura normal.
+        """
+        estaciones = np.asarray(estaciones, dtype=np.int64)
+        valores = np.column_stack([
+            np.asarray(temperaturas, dtype=np.float64),
+            np.asarray(humedades, dtype=np.float64),
+        ])
+        n = estaciones.shape[0]
+        codigos = np.zeros(n, dtype=np.int64)
+        if n == 0:
+            return codigos
+        if n <= self.lote_escalar:
+            for i, (estacion_id, (temperatura, humedad)) in enumerate(
+                    zip(estaciones.tolist(), valores.tolist())):
+                codigos[i] = self.evaluar_lectura(estacion_id, temperatura, humedad)
+            return codigos
+
+        # Pocas estaciones distintas por lote: el dict solo se consulta por id único
+        unicas, posicion = np.unique(estaciones, return_inverse=True)
+        filas = self._filas
+        estaciones = np.array(
+            [filas.setdefault(int(e), len(filas)) for e in unicas.tolist()],
+            dtype=np.int64,
+        )[posicion.reshape(-1)]
+        self._asegurar_capacidad(len(filas))
+
+        for inicio in range(0, n, self._tamano_trozo):
+            fin = min(inicio + self._tamano_trozo, n)
+            codigos[inicio:fin] = self._evaluar_trozo(
+                estaciones[inicio:fin], valores[inicio:fin]
+            )
+        return codigos
+
+    def _evaluar_trozo(self, estaciones, valores):
+        n = estaciones.shape[0]
+        a = self.alpha
+        b = 1.0 - a
+
+        # Agrupar por estación conservando el orden de llegada
+        orden = np.argsort(estaciones, kind="stable")
+        est = estaciones[orden]
+        val = valores[orden]
+
+        es_inicio = np.empty(n, dtype=bool)
+        es_inicio[0] = True
+        np.not_equal(est[1:], est[:-1], out=es_inicio[1:])
+        inicios = np.flatnonzero(es_inicio)
+        finales = np.append(inicios[1:] - 1, n - 1)
+        grupo = np.cumsum(es_inicio) - 1
+        indices = np.arange(n)
+        pos = indices - inicios[grupo]
+        ids = est[inicios]
+
+        # Estaciones nuevas: sembrar la media con su primera lectura
+        nuevas = self._conteo[ids] == 0
+        if nuevas.any():
+            self._media[ids[nuevas]] = val[inicios[nuevas]]
+            self._varianza[ids[nuevas]] = 0.0
+
+        media0 = self._media[est]
+        varianza0 = self._varianza[est]
+        conteo_previo = self._conteo[est] + pos
+
+        # Media EWMA previa a cada lectura en forma cerrada:
+        # m_{j-1} = b^j * (m0 + a * sum_{i<j} b^-i x_i / b)
+        potencia = (b ** pos)[:, None]
+        peso = 1.0 / potencia
+        media_previa = potencia * (
+            media0 + a * self._suma_exclusiva(peso * val, inicios, grupo) / b
+        )
+        diff = val - media_previa
+
+        # Varianza EWMA: v_j = b * (v_{j-1} + a * d_j^2), misma forma cerrada
+        aporte = b * a * diff * diff
+        varianza_previa = np.maximum(potencia * (
+            varianza0 + self._suma_exclusiva(peso * aporte, inicios, grupo) / b
+        ), 0.0)
+
+        # La varianza parte de 0: corregir el sesgo de arranque de la EWMA
+        calentado = (conteo_previo >= self.calentamiento)[:, None]
+        varianza_corregida = varianza_previa / np.maximum(
+            1.0 - b ** conteo_previo, a
+        )[:, None]
+        con_varianza = varianza_corregida >= self.varianza_minima
+        pico = calentado & con_varianza & (
+            np.abs(diff) > self.umbral_pico * np.sqrt(varianza_corregida)
+        )
+        plano = calentado & ~con_varianza
+
+        # Rachas de valores idénticos, continuando la racha del lote anterior
+        anterior = np.empty_like(val)
+        anterior[1:] = val[:-1]
+        anterior[inicios] = self._ultimo[ids]
+        igual = val == anterior
+        ultimo_corte = np.maximum.accumulate(
+            np.where(igual, -1, indices[:, None]), axis=0
+        )
+        sin_corte = ultimo_corte < inicios[grupo][:, None]
+        racha = np.where(
+            sin_corte,
+            self._racha[est] + pos[:, None] + 1,
+            indices[:, None] - ultimo_corte + 1,
+        )
+        atascado = racha >= self.repeticiones_atasco
+
+        fuera_rango = np.column_stack([
+            (val[:, 0] < RANGO_TEMPERATURA[0]) | (val[:, 0] > RANGO_TEMPERATURA[1]),
+            (val[:, 1] < RANGO_HUMEDAD[0]) | (val[:, 1] > RANGO_HUMEDAD[1]),
+        ])
+
+        codigos_ordenados = (
+            pico.any(axis=1) * PICO
+            | plano.any(axis=1) * PLANO
+            | atascado.any(axis=1) * ATASCADO
+            | fuera_rango.any(axis=1) * FUERA_RANGO
+        )
+
+        # Guardar el estado tras la última lectura de cada estación
+        d_fin = diff[finales]
+        self._media[ids] = media_previa[finales] + a * d_fin
+        self._varianza[ids] = b * (varianza_previa[finales] + a * d_fin * d_fin)
+        self._conteo[ids] += finales - inicios + 1
+        self._ultimo[ids] = val[finales]
+        self._racha[ids] = racha[finales]
+
+        codigos = np.empty(n, dtype=np.int64)
+        codigos[orden] = codigos_ordenados
+        return codigos
+
+    def evaluar_lectura(self, estacion_id, temperatura, humedad):
+        """
+        Camino escalar para lotes pequeños (p. ej. el carril prioritario o
+        lotes vaciados por timeout_lote): la misma actualización que
+        _evaluar_trozo con floats de Python, sin el costo fijo de las
+        operaciones NumPy. Devuelve el código de anomalía.
+        """
+        filas = self._filas
+        fila = filas.setdefault(estacion_id, len(filas))
+        self._asegurar_capacidad(len(filas))
+
+        a = self.alpha
+        b = 1.0 - a
+        conteo = int(self._conteo[fila])
+        calentado = conteo >= self.calentamiento
+        divisor = max(1.0 - b ** conteo, a)
+        medias = self._media[fila].tolist()
+        varianzas = self._varianza[fila].tolist()
+        ultimos = self._ultimo[fila].tolist()
+        rachas = self._racha[fila].tolist()
+        rangos = (RANGO_TEMPERATURA, RANGO_HUMEDAD)
+
+        codigo = 0
+        for j, valor in enumerate((temperatura, humedad)):
+            if conteo == 0:
+                # Estación nueva: la media parte de su primera lectura
+                medias[j], varianzas[j] = valor, 0.0
+            diff = valor - medias[j]
+            varianza = max(varianzas[j], 0.0)
+
+            varianza_corregida = varianza / divisor
+            if calentado:
+                if varianza_corregida < self.varianza_minima:
+                    codigo |= PLANO
+                elif abs(diff) > self.umbral_pico * math.sqrt(varianza_corregida):
+                    codigo |= PICO
+
+            rachas[j] = rachas[j] + 1 if valor == ultimos[j] else 1
+            if rachas[j] >= self.repeticiones_atasco:
+                codigo |= ATASCADO
+
+            minimo, maximo = rangos[j]
+            if valor < minimo or valor > maximo:
+                codigo |= FUERA_RANGO
+
+            medias[j] += a * diff
+            varianzas[j] = b * (varianza + a * diff * diff)
+            ultimos[j] = valor
+
+        self._media[fila] = medias
+        self._varianza[fila] = varianzas
+        self._conteo[fila] = conteo + 1
+        self._ultimo[fila] = ultimos
+        self._racha[fila] = rachas
+        return codigo
+
+    @staticmethod
+    def _suma_exclusiva(valores, inicios, grupo):
+        """Suma acumulada por grupo que excluye el elemento actual."""
+        acumulado = np.cumsum(valores, axis=0)
+        base = acumulado[inicios] - valores[inicios]
+        return acumulado - valores - base[grupo]
+
+
+class EtapaAnomalias:
+    """
+    Etapa del pipeline: evalúa el lote de Lectura con el detector y separa
+    lecturas normales y anómalas (pares (Lectura, motivo)).
+    """
+
+    def __init__(self, detector=None):
+        self.detector = detector or DetectorAnomalias()
+
+    def __call__(self, lecturas):
+        n = len(lecturas)
+        if n == 0:
+            return lecturas, []
+        if n <= self.detector.lote_escalar:
+            evaluar = self.detector.evaluar_lectura
+            normales, anomalias = [], []
+            for lectura in lecturas:
+                codigo = evaluar(
+                    lectura.estacion_id, float(lectura.temperatura), float(lectura.humedad)
+                )
+                if codigo:
+                    anomalias.append((lectura, describir(codigo)))
+                else:
+                    normales.append(lectura)
+            return normales, anomalias
+
+        codigos = self.detector.evaluar(
+            np.fromiter((l.estacion_id for l in lecturas), dtype=np.int64, count=n),
+            np.fromiter((l.temperatura for l in lecturas), dtype=np.float64, count=n),
+            np.fromiter((l.humedad for l in lecturas), dtype=np.float64, count=n),
+        )
+        if not codigos.any():
+            return lecturas, []
+
+        normales = [lecturas[i] for i in np.flatnonzero(codigos == 0)]
+        anomalias = [(lecturas[i], describir(codigos[i])) for i in np.flatnonzero(codigos)]
+        return normales, anomalias
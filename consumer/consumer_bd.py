@@ -1,10 +1,13 @@
-import psycopg2
+import io
 import os
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# psycopg2 se importa al conectar (arranque perezoso): así la importación
+# puede solaparse con la conexión a RabbitMQ (ver FAST_START)
+
 postgres_config = {
     "host": os.getenv("POSTGRES_HOST", "postgres"),
     "database": os.getenv("POSTGRES_DB", "logsdb"),
@@ -14,19 +17,59 @@ postgres_config = {
 }
 
 db_connection = None
+# Conexión a la que corresponde sentencias_preparadas (ver _preparar)
+conexion_preparada = None
+# Nombres ya preparados en conexion_preparada
+sentencias_preparadas = set()
+# Event de cierre ordenado (consumer_core.instalar_parada): corta los
+# reintentos de conexión, también los de validar_conexion durante el drenado
+parada_conexion = None
+
+# libpq interpreta connect_timeout < 2 como 2 s
+CONNECT_TIMEOUT_MINIMO = 2
+
+
+def _restante(plazo):
+    """Segundos hasta `plazo` (time.monotonic); None sin plazo."""
+    return None if plazo is None else plazo - time.monotonic()
+
+
+def conectar_postgres(parada=None, plazo=None):
+    """
+    Conecta reintentando cada 3 s. Con `parada` activada deja de reintentar
+    (tras al menos un intento) y devuelve None. Con `plazo` (time.monotonic)
+    hace un solo intento cuyo connect_timeout no lo supera.
+    """
+    global db_connection, parada_conexion
+    import psycopg2
+
+    if parada is not None:
+        parada_conexion = parada
+
+    config = postgres_config
+    if plazo is not None:
+        segundos = min(int(_restante(plazo)), postgres_config["connect_timeout"])
+        if segundos < CONNECT_TIMEOUT_MINIMO:
+            logger.warning("Sin tiempo para reconectar a PostgreSQL antes del plazo")
+            return None
+        config = {**postgres_config, "connect_timeout": segundos}
 
-def conectar_postgres():
-    global db_connection
     while True:
         try:
-            db_connection = psycopg2.connect(**postgres_config)
+            db_connection = psycopg2.connect(**config)
             logger.info("Conexión establecida con PostgreSQL")
             return db_connection
         except Exception as e:
             logger.error(f"Error al conectar a PostgreSQL: {e}")
-            time.sleep(3)
+            if plazo is not None:
+                return None
+            if parada_conexion is None:
+                time.sleep(3)
+            elif parada_conexion.wait(3):
+                logger.info("Parada solicitada, sin más reintentos de conexión")
+                return None
 
-def validar_conexion():
+def validar_conexion(plazo=None):
     global db_connection
     try:
         if db_connection and not db_connection.closed:
@@ -34,23 +77,150 @@ def validar_conexion():
             return db_connection
     except Exception:
         pass
-    return conectar_postgres()
+    return conectar_postgres(plazo=plazo)
+
+def cerrar_conexion():
+    global db_connection, conexion_preparada
+    if db_connection and not db_connection.closed:
+        db_connection.close()
+    db_connection = None
+    conexion_preparada = None
+    sentencias_preparadas.clear()
+
+
+SQL_INSERT = """
+    INSERT INTO weather_logs (estacion_id, temperatura, humedad, fecha)
+    VALUES (%s, %s, %s, %s)
+"""
+
+SQL_INSERT_LOTE = """
+    INSERT INTO weather_logs (estacion_id, temperatura, humedad, fecha)
+    VALUES %s
+"""
+
+SQL_INSERT_ANOMALIA = """
+    INSERT INTO weather_logs_anomalias
+        (estacion_id, temperatura, humedad, fecha, motivo)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+SQL_INSERT_ANOMALIAS_LOTE = """
+    INSERT INTO weather_logs_anomalias
+        (estacion_id, temperatura, humedad, fecha, motivo)
+    VALUES %s
+"""
+
+# Solo dentro de la transacción: con el commit o rollback vuelve el valor normal
+SQL_STATEMENT_TIMEOUT = "SET LOCAL statement_timeout = %s"
+
+SQL_COPY = "COPY weather_logs (estacion_id, temperatura, humedad, fecha) FROM STDIN"
+
+# Resúmenes por (estación, minuto) de las lecturas que exceden el límite
+# por estación (ver consumer_limites.AgregadorExceso)
+SQL_UPSERT_RESUMENES = """
+    INSERT INTO weather_logs_rollup
+        (estacion_id, minuto, muestras, suma_temperatura, suma_humedad)
+    VALUES %s
+    ON CONFLICT (estacion_id, minuto) DO UPDATE SET
+        muestras = weather_logs_rollup.muestras + EXCLUDED.muestras,
+        suma_temperatura = weather_logs_rollup.suma_temperatura + EXCLUDED.suma_temperatura,
+        suma_humedad = weather_logs_rollup.suma_humedad + EXCLUDED.suma_humedad
+"""
 
-def insertar_weather_log(data):
-    
-    conn = validar_conexion()
+# Sentencias preparadas en el servidor, cada una la primera vez que se usa
+# en la conexión: los lotes siguientes envían solo EXECUTE con los
+# parámetros, sin texto SQL que analizar y planificar de nuevo. Un consumer
+# sin anomalías ni resúmenes solo necesita weather_logs.
+SENTENCIAS_PREPARADAS = {
+    "insertar_lectura": """
+    PREPARE insertar_lectura (INT, NUMERIC, NUMERIC, TIMESTAMP) AS
+        INSERT INTO weather_logs (estacion_id, temperatura, humedad, fecha)
+        VALUES ($1, $2, $3, $4)
+    """,
+    "insertar_anomalia": """
+    PREPARE insertar_anomalia (INT, DOUBLE PRECISION, DOUBLE PRECISION, TIMESTAMP, TEXT) AS
+        INSERT INTO weather_logs_anomalias
+            (estacion_id, temperatura, humedad, fecha, motivo)
+        VALUES ($1, $2, $3, $4, $5)
+    """,
+    "upsert_resumen": """
+    PREPARE upsert_resumen (INT, TIMESTAMP, INT, DOUBLE PRECISION, DOUBLE PRECISION) AS
+        INSERT INTO weather_logs_rollup
+            (estacion_id, minuto, muestras, suma_temperatura, suma_humedad)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (estacion_id, minuto) DO UPDATE SET
+            muestras = weather_logs_rollup.muestras + EXCLUDED.muestras,
+            suma_temperatura = weather_logs_rollup.suma_temperatura + EXCLUDED.suma_temperatura,
+            suma_humedad = weather_logs_rollup.suma_humedad + EXCLUDED.suma_humedad
+    """,
+}
+
+SQL_EXECUTE_LECTURA = "EXECUTE insertar_lectura (%s, %s, %s, %s)"
+SQL_EXECUTE_ANOMALIA = "EXECUTE insertar_anomalia (%s, %s, %s, %s, %s)"
+SQL_EXECUTE_RESUMEN = "EXECUTE upsert_resumen (%s, %s, %s, %s, %s)"
+
+# EXECUTE por viaje de red: execute_batch los concatena con ";" y los
+# envía juntos en lugar de esperar el resultado de cada uno
+PAGINA_PREPARADAS = 100
+
+
+def _preparar(cursor, nombre):
+    """
+    PREPARE de SENTENCIAS_PREPARADAS[nombre] si la conexión del cursor aún
+    no la tiene. En una conexión nueva o tras un fallo (ver
+    _olvidar_preparadas) empieza con DEALLOCATE ALL: ROLLBACK no deshace
+    PREPARE, así que no se sabe qué quedó preparado.
+    """
+    global conexion_preparada
+    if conexion_preparada is not cursor.connection:
+        cursor.execute("DEALLOCATE ALL")
+        sentencias_preparadas.clear()
+        conexion_preparada = cursor.connection
+    if nombre not in sentencias_preparadas:
+        cursor.execute(SENTENCIAS_PREPARADAS[nombre])
+        sentencias_preparadas.add(nombre)
+        logger.info("Sentencia %s preparada en la conexión a PostgreSQL", nombre)
+
+
+def _olvidar_preparadas():
+    global conexion_preparada
+    conexion_preparada = None
+    sentencias_preparadas.clear()
+
+
+def _en_transaccion(escribir, lecturas, anomalias, resumenes=(), resumir=None,
+                    plazo=None):
+    """
+    Ejecuta escribir(cursor, lecturas, anomalias) y
+    resumir(cursor, resumenes) en una sola transacción.
+
+    `lecturas` son las Lectura normales (van a weather_logs), `anomalias`
+    pares (Lectura, motivo) que se desvían a weather_logs_anomalias y
+    `resumenes` filas de AgregadorExceso.extraer() para weather_logs_rollup.
+
+    Con `plazo` (time.monotonic, drenado) la reconexión y las sentencias no
+    lo superan: statement_timeout con el tiempo restante; si se agota, la
+    transacción se deshace y devuelve False.
+    """
+    resumir = resumir or _escribir_resumenes
+    conn = validar_conexion(plazo)
+    if conn is None:
+        return False
+    restante = _restante(plazo)
+    if restante is not None and restante <= 0:
+        logger.warning("Plazo de escritura agotado antes de empezar")
+        return False
     cursor = conn.cursor()
     try:
-        cursor.execute(
-            """
-            INSERT INTO weather_logs (estacion_id, temperatura, humedad, fecha)
-            VALUES (%s, %s, %s, %s)
-            """,
-            (data["estacion_id"], data["temperatura"],
-             data["humedad"], data["fecha"])
-        )
+        if restante is not None:
+            cursor.execute(SQL_STATEMENT_TIMEOUT, (max(1, int(_restante(plazo) * 1000)),))
+        escribir(cursor, lecturas, anomalias)
+        resumir(cursor, resumenes)
         conn.commit()
-        logger.info(f"Insertado en BD: {data}")
+        logger.debug(
+            "Insertado en BD: %d lecturas, %d anomalías",
+            len(lecturas), len(anomalias)
+        )
         return True
     except Exception as e:
         logger.error(f"Error al insertar dato: {e}")
@@ -64,3 +234,132 @@ def insertar_weather_log(data):
             cursor.close()
         except Exception:
             pass
+
+
+def _escribir_por_fila(cursor, lecturas, anomalias):
+    for lectura in lecturas:
+        cursor.execute(SQL_INSERT, lectura.como_fila())
+    for lectura, motivo in anomalias:
+        cursor.execute(SQL_INSERT_ANOMALIA, lectura.como_fila() + (motivo,))
+
+
+def _escribir_anomalias(cursor, anomalias):
+    from psycopg2.extras import execute_values
+
+    if anomalias:
+        execute_values(
+            cursor,
+            SQL_INSERT_ANOMALIAS_LOTE,
+            [lectura.como_fila() + (motivo,) for lectura, motivo in anomalias]
+        )
+
+
+def _escribir_resumenes(cursor, resumenes):
+    from psycopg2.extras import execute_values
+
+    if resumenes:
+        execute_values(cursor, SQL_UPSERT_RESUMENES, resumenes)
+
+
+def _escribir_preparado(cursor, lecturas, anomalias):
+    from psycopg2.extras import execute_batch
+
+    if lecturas:
+        _preparar(cursor, "insertar_lectura")
+        execute_batch(
+            cursor, SQL_EXECUTE_LECTURA,
+            [lectura.como_fila() for lectura in lecturas],
+            page_size=PAGINA_PREPARADAS
+        )
+    if anomalias:
+        _preparar(cursor, "insertar_anomalia")
+        execute_batch(
+            cursor, SQL_EXECUTE_ANOMALIA,
+            [lectura.como_fila() + (motivo,) for lectura, motivo in anomalias],
+            page_size=PAGINA_PREPARADAS
+        )
+
+
+def _resumir_preparado(cursor, resumenes):
+    from psycopg2.extras import execute_batch
+
+    if resumenes:
+        _preparar(cursor, "upsert_resumen")
+        execute_batch(cursor, SQL_EXECUTE_RESUMEN, resumenes, page_size=PAGINA_PREPARADAS)
+
+
+def _escribir_lote(cursor, lecturas, anomalias):
+    from psycopg2.extras import execute_values
+
+    if lecturas:
+        execute_values(
+            cursor,
+            SQL_INSERT_LOTE,
+            [lectura.como_fila() for lectura in lecturas]
+        )
+    _escribir_anomalias(cursor, anomalias)
+
+
+def _campo_copy(valor):
+    """Escapa un valor para el formato texto de COPY."""
+    return (
+        str(valor)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _escribir_copy(cursor, lecturas, anomalias):
+    if lecturas:
+        buffer = io.StringIO()
+        for lectura in lecturas:
+            buffer.write(
+                f"{lectura.estacion_id}\t{lectura.temperatura}\t"
+                f"{lectura.humedad}\t{_campo_copy(lectura.fecha)}\n"
+            )
+        buffer.seek(0)
+        cursor.copy_expert(SQL_COPY, buffer)
+    _escribir_anomalias(cursor, anomalias)
+
+
+def insertar_por_fila(lecturas, anomalias, resumenes=(), plazo=None):
+    """Sumidero por fila: un INSERT por lectura, un commit por lote."""
+    return _en_transaccion(_escribir_por_fila, lecturas, anomalias, resumenes, plazo=plazo)
+
+
+def insertar_lote(lecturas, anomalias, resumenes=(), plazo=None):
+    """Sumidero por lote: INSERT multi-fila con execute_values."""
+    return _en_transaccion(_escribir_lote, lecturas, anomalias, resumenes, plazo=plazo)
+
+
+def copiar_lote(lecturas, anomalias, resumenes=(), plazo=None):
+    """Sumidero COPY: COPY FROM STDIN para weather_logs."""
+    return _en_transaccion(_escribir_copy, lecturas, anomalias, resumenes, plazo=plazo)
+
+
+def insertar_preparado(lecturas, anomalias, resumenes=(), plazo=None):
+    """
+    Sumidero preparado: EXECUTE de sentencias preparadas, varios por viaje.
+    Prepara en la misma transacción solo lo que el lote usa.
+    """
+    ok = _en_transaccion(
+        _escribir_preparado, lecturas, anomalias, resumenes,
+        resumir=_resumir_preparado, plazo=plazo
+    )
+    if not ok:
+        _olvidar_preparadas()
+    return ok
+
+
+def insertar_weather_log(lectura):
+    return insertar_preparado([lectura], [])
+
+
+SUMIDEROS = {
+    "row": insertar_por_fila,
+    "batch": insertar_lote,
+    "copy": copiar_lote,
+    "prepared": insertar_preparado,
+}
@@ -0,0 +1,65 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # dependencia opcional
+    zstandard = None
+
+# Debe ser idéntico a producer/producer_compresion.py (ver tests)
+DICCIONARIO_V1 = (
+    b'{"estacion_id": 5, "temperatura": 34.87, "humedad": 89.12, "fecha": "2025-12-31T23:59:59.999999"}'
+    b'{"estacion_id": 3, "temperatura": 22.05, "humedad": 64.71, "fecha": "2026-01-15T08:30:15.500000"}'
+    b'{"estacion_id": 1, "temperatura": 18.43, "humedad": 47.36, "fecha": "2026-10-19T12:30:45.123456"}'
+)
+
+ENCODING_ZLIB = "zlib-dict-v1"
+ENCODING_ZSTD = "zstd-dict-v1"
+
+# Tope del cuerpo descomprimido (evita bombas de descompresión)
+MAX_DESCOMPRIMIDO = 1024 * 1024
+
+# Descompresor deflate crudo con el diccionario ya cargado (se copia por
+# mensaje). Ventana máxima: acepta cualquier ventana usada al comprimir.
+_zlib_base = zlib.decompressobj(-15, zdict=DICCIONARIO_V1)
+_zstd = None
+
+
+def _descomprimir_zlib(body):
+    descompresor = _zlib_base.copy()
+    datos = descompresor.decompress(body, MAX_DESCOMPRIMIDO)
+    if descompresor.unconsumed_tail:
+        raise ValueError(f"Cuerpo descomprimido > {MAX_DESCOMPRIMIDO} bytes")
+    if not descompresor.eof:
+        raise ValueError("Mensaje deflate truncado")
+    return datos
+
+
+def _descomprimir_zstd(body):
+    global _zstd
+    if zstandard is None:
+        raise ValueError("zstandard no está instalado")
+    if _zstd is None:
+        diccionario = zstandard.ZstdCompressionDict(
+            DICCIONARIO_V1, dict_type=zstandard.DICT_TYPE_RAWCONTENT
+        )
+        _zstd = zstandard.ZstdDecompressor(dict_data=diccionario)
+    if zstandard.frame_content_size(body) > MAX_DESCOMPRIMIDO:
+        raise ValueError(f"Cuerpo descomprimido > {MAX_DESCOMPRIMIDO} bytes")
+    return _zstd.decompress(body, max_output_size=MAX_DESCOMPRIMIDO)
+
+
+def descomprimir(body, content_encoding):
+    """
+    Devuelve el cuerpo sin comprimir según content_encoding.
+    Lanza ValueError si la codificación es desconocida o el cuerpo es inválido.
+    """
+    if not content_encoding:
+        return body
+    try:
+        if content_encoding == ENCODING_ZLIB:
+            return _descomprimir_zlib(body)
+        if content_encoding == ENCODING_ZSTD:
+            return _descomprimir_zstd(body)
+    except Exception as e:  # zlib.error, zstandard.ZstdError, truncado
+        raise ValueError(f"Error descomprimiendo ({content_encoding}): {e}") from e
+    raise ValueError(f"content_encoding no soportado: {content_encoding}")
@@ -0,0 +1,731 @@
+"""
+Núcleo compartido del consumer:
+
+    fuente -> decodificación (descompresión + JSON) -> validación -> etapas -> sumidero
+
+- Fuentes: consumir_bloqueante (BlockingConnection) y consumir_async
+  (SelectConnection). Ambas entregan cada mensaje a Pipeline.callback.
+- Etapas: callables lecturas -> (normales, desviadas), p. ej.
+  consumer_anomalias.EtapaAnomalias.
+- Sumideros: callables (lecturas, anomalias, resumenes, plazo=None) -> bool,
+  ver consumer_bd.SUMIDEROS (por fila, lote, COPY). `plazo` solo llega al
+  drenar: la escritura no debe superarlo.
+- Límite por estación (opcional): consumer_limites.LimitadorEstaciones;
+  el exceso se resume (weather_logs_rollup) o se descarta.
+- Carril prioritario (opcional): cola aparte para estaciones críticas,
+  con su propio canal, prefetch y Pipeline.
+- Cierre ordenado: con `parada` (ver instalar_parada) las fuentes cancelan
+  el consumo, escriben los lotes pendientes dentro de `plazo_drenado`,
+  confirman lo escrito, devuelven el resto a la cola y cierran canales.
+
+Pipeline no depende del broker: recibe un "canal" con basic_ack/basic_nack,
+por lo que sus etapas se pueden medir con un canal falso
+(benchmarks/bench_pipeline.py).
+
+pika se importa dentro de las fuentes (arranque perezoso, ver fast_start).
+"""
+
+import logging
+import time
+
+from consumer_compresion import descomprimir
+from consumer_limites import AgregadorExceso
+from consumer_validacion import validar_mensaje
+
+logger = logging.getLogger(__name__)
+
+EXCHANGE_DATOS = "weather.data"
+EXCHANGE_DLX = "weather.dlx"
+COLA_DLX = "logs_dlx"
+
+RUTA_ESTACIONES = "station.*"
+# El producer publica las estaciones críticas como station.<id>.critical
+# ('*' es exactamente una palabra: station.* no las recibe)
+RUTA_CRITICAS = "station.*.critical"
+# Cola general sin carril prioritario: recibe también las críticas
+RUTAS_GENERAL = (RUTA_ESTACIONES, RUTA_CRITICAS)
+
+MODOS_EXCESO = ("aggregate", "shed")
+
+METRICS_INTERVAL = 30
+PLAZO_DRENADO = 5.0
+
+
+def enlaces(cola, rutas):
+    """
+    Bindings de la cola a weather.data. Si la cola no lleva RUTA_CRITICAS
+    (la general con carril prioritario activo) se desenlaza, por si quedó
+    de un arranque sin carril: así las críticas no llegan a dos colas.
+    """
+    pasos = [
+        ("queue_bind", {"queue": cola, "exchange": EXCHANGE_DATOS, "routing_key": ruta})
+        for ruta in rutas
+    ]
+    if RUTA_CRITICAS not in rutas:
+        pasos.append(("queue_unbind", {
+            "queue": cola, "exchange": EXCHANGE_DATOS, "routing_key": RUTA_CRITICAS,
+        }))
+    return pasos
+
+
+def topologia(cola, rutas=RUTAS_GENERAL):
+    """Declaraciones de exchanges, colas y bindings como (método, kwargs)."""
+    return [
+        ("exchange_declare", {"exchange": EXCHANGE_DATOS, "exchange_type": "topic", "durable": True}),
+        ("exchange_declare", {"exchange": EXCHANGE_DLX, "exchange_type": "fanout", "durable": True}),
+        ("queue_declare", {
+            "queue": cola,
+            "durable": True,
+            "arguments": {"x-dead-letter-exchange": EXCHANGE_DLX},
+        }),
+        *enlaces(cola, rutas),
+        ("queue_declare", {"queue": COLA_DLX, "durable": True}),
+        ("queue_bind", {"queue": COLA_DLX, "exchange": EXCHANGE_DLX}),
+    ]
+
+
+def declarar_topologia(channel, cola, rutas=RUTAS_GENERAL):
+    for metodo, kwargs in topologia(cola, rutas):
+        getattr(channel, metodo)(**kwargs)
+
+
+def topologia_pasiva(cola, rutas=RUTAS_GENERAL):
+    """
+    Comprobación barata de que la topología ya existe: declaraciones
+    pasivas de las dos colas. Los bindings no se pueden comprobar así, pero
+    son idempotentes y baratos, de modo que se (re)aplican siempre: un
+    cambio de PRIORITY_LANE no depende de redeclarar todo.
+    """
+    return [
+        ("queue_declare", {"queue": cola, "passive": True}),
+        ("queue_declare", {"queue": COLA_DLX, "passive": True}),
+        *enlaces(cola, rutas),
+    ]
+
+
+def preparar_canal(connection, cola, fast_start=False, rutas=RUTAS_GENERAL):
+    """
+    Abre el canal de consumo. Con fast_start solo comprueba pasivamente
+    la topología y la declara completa únicamente si falta algo.
+    """
+    from pika.exceptions import ChannelClosedByBroker
+
+    channel = connection.channel()
+    if fast_start:
+        try:
+            declarar_topologia_pasiva(channel, cola, rutas)
+            logger.info("Topología existente, se omite la declaración")
+            return channel
+        except ChannelClosedByBroker as e:
+            # 404: el broker cierra el canal, se abre otro y se declara todo
+            logger.info(f"Topología incompleta ({e}), declarando")
+            channel = connection.channel()
+
+    declarar_topologia(channel, cola, rutas)
+    return channel
+
+
+def declarar_topologia_pasiva(channel, cola, rutas=RUTAS_GENERAL):
+    for metodo, kwargs in topologia_pasiva(cola, rutas):
+        getattr(channel, metodo)(**kwargs)
+
+
+def declarar_topologia_async(channel, cola, al_terminar, pasos=None):
+    """Encadena las declaraciones por callbacks y luego llama al_terminar()."""
+    pendientes = pasos if pasos is not None else topologia(cola)
+
+    def siguiente(_frame=None):
+        if not pendientes:
+            al_terminar()
+            return
+        metodo, kwargs = pendientes.pop(0)
+        getattr(channel, metodo)(callback=siguiente, **kwargs)
+
+    siguiente()
+
+
+class Pipeline:
+    """
+    Decodifica, valida y acumula mensajes; al completar el lote aplica las
+    etapas, escribe en el sumidero y confirma todas sus entregas.
+    """
+
+    def __init__(self, sumidero, etapas=(), decodificar=validar_mensaje,
+                 tamano_lote=1, timeout_lote=1.0, etiqueta="CONSUMER",
+                 log_sample_every=1000, t_arranque=None,
+                 limitador=None, modo_exceso="aggregate"):
+        if modo_exceso not in MODOS_EXCESO:
+            raise ValueError(f"Modo de exceso desconocido: {modo_exceso}")
+        self.sumidero = sumidero
+        self.etapas = list(etapas)
+        self.decodificar = decodificar
+        self.tamano_lote = max(1, tamano_lote)
+        self.timeout_lote = timeout_lote
+        self.etiqueta = etiqueta
+        self.log_sample_every = max(1, log_sample_every)
+        # Inicio del proceso, para medir el tiempo hasta el primer mensaje
+        self.t_arranque = t_arranque if t_arranque is not None else time.time()
+
+        self.limitador = limitador
+        self.modo_exceso = modo_exceso
+
+        # Listas paralelas, sin tuplas por mensaje: delivery_tag y Lectura.
+        # lote_tags incluye también las entregas limitadas (se confirman
+        # con el lote aunque su lectura vaya al resumen o se descarte).
+        self.lote_tags = []
+        self.lote_lecturas = []
+        self.lote_exceso = AgregadorExceso()
+        self.lote_inicio = 0.0
+        # En cierre: las entregas tardías vuelven a la cola sin procesarse
+        self.drenando = False
+        # Event de cierre ordenado (ver instalar_parada), lo asignan las fuentes
+        self.parada = None
+
+        self.metrics = {
+            "messages_received": 0,
+            "db_ok": 0,
+            "db_errors": 0,
+            "json_errors": 0,
+            "anomalies": 0,
+            "batches": 0,
+            "time_to_first_message": None,
+            "throttled": 0,
+            "shed": 0,
+            "throttled_by_station": {},
+            "shed_by_station": {},
+            "requeued": 0,
+            "total_processing_time": 0.0,
+            "start_time": time.time(),
+            "last_log": time.time(),
+        }
+
+    def callback(self, ch, method, properties, body):
+        """on_message_callback de pika."""
+        self.recibir(ch, method.delivery_tag, body, properties.content_encoding)
+
+    def recibir(self, canal, delivery_tag, body, content_encoding=None):
+        start = time.perf_counter()
+        metrics = self.metrics
+        if self.drenando:
+            canal.basic_nack(delivery_tag=delivery_tag, requeue=True)
+            metrics["requeued"] += 1
+            return
+        metrics["messages_received"] += 1
+        if metrics["time_to_first_message"] is None:
+            metrics["time_to_first_message"] = time.time() - self.t_arranque
+            logger.info(
+                "[ARRANQUE %s] primer mensaje a los %.3fs",
+                self.etiqueta, metrics["time_to_first_message"]
+            )
+
+        lectura, error = None, None
+        if content_encoding:
+            try:
+                body = descomprimir(body, content_encoding)
+            except ValueError as e:
+                logger.error("%s", e)
+                error = "compresion_invalida"
+
+        if error is None:
+            lectura, error = self.decodificar(body)
+
+        if error is not None:
+            metrics["json_errors"] += 1
+            logger.warning("Mensaje inválido, descartar. Error: %s", error)
+            canal.basic_nack(delivery_tag=delivery_tag, requeue=False)
+            return
+
+        if (metrics["messages_received"] % self.log_sample_every == 0
+                and logger.isEnabledFor(logging.DEBUG)):
+            logger.debug(
+                "Mensaje recibido (muestra 1/%d): %r", self.log_sample_every, lectura
+            )
+
+        if not self.lote_tags:
+            self.lote_inicio = time.time()
+        self.lote_tags.append(delivery_tag)
+        if self.limitador is None or self.limitador.permitir(lectura.estacion_id, start):
+            self.lote_lecturas.append(lectura)
+        else:
+            self._exceso(lectura)
+
+        metrics["total_processing_time"] += time.perf_counter() - start
+
+        if len(self.lote_tags) >= self.tamano_lote:
+            self.vaciar(canal)
+
+        if time.time() - metrics["last_log"] >= METRICS_INTERVAL:
+            self.log_metrics()
+
+    def _exceso(self, lectura):
+        """Lectura por encima del límite de su estación: resumir o descartar."""
+        metrics = self.metrics
+        estacion_id = lectura.estacion_id
+        if self.modo_exceso == "aggregate" and self.lote_exceso.agregar(lectura):
+            metrics["throttled"] += 1
+            por_estacion = metrics["throttled_by_station"]
+        else:
+            metrics["shed"] += 1
+            por_estacion = metrics["shed_by_station"]
+        por_estacion[estacion_id] = por_estacion.get(estacion_id, 0) + 1
+
+    def transformar(self, lecturas):
+        """Aplica las etapas en orden; cada una puede desviar lecturas."""
+        desviadas = []
+        for etapa in self.etapas:
+            lecturas, nuevas = etapa(lecturas)
+            desviadas.extend(nuevas)
+        return lecturas, desviadas
+
+    def vaciar(self, canal, requeue_fallo=False, plazo=None):
+        """
+        Escribe el lote pendiente y confirma (o rechaza) todas sus entregas.
+        Devuelve True si el lote quedó escrito.
+
+        Un fallo con la parada ya activada devuelve el lote a la cola, no a
+        logs_dlx: suele deberse al propio cierre (conectar_postgres deja de
+        reintentar).
+        """
+        if not self.lote_tags:
+            return True
+
+        start = time.perf_counter()
+        metrics = self.metrics
+        ultimo_tag = self.lote_tags[-1]
+        entregas = len(self.lote_tags)
+        lecturas = self.lote_lecturas[:]
+        resumenes = self.lote_exceso.extraer()
+        self.lote_tags.clear()
+        self.lote_lecturas.clear()
+
+        normales, anomalias = self.transformar(lecturas)
+        if plazo is None:
+            ok = self.sumidero(normales, anomalias, resumenes)
+        else:
+            ok = self.sumidero(normales, anomalias, resumenes, plazo=plazo)
+
+        metrics["batches"] += 1
+        if ok:
+            metrics["db_ok"] += len(lecturas)
+            metrics["anomalies"] += len(anomalias)
+            canal.basic_ack(delivery_tag=ultimo_tag, multiple=True)
+        else:
+            metrics["db_errors"] += len(lecturas)
+            if not requeue_fallo and self.parada is not None and self.parada.is_set():
+                # drenar() no verá este lote: se cuenta aquí
+                requeue_fallo = True
+                metrics["requeued"] += entregas
+            canal.basic_nack(delivery_tag=ultimo_tag, multiple=True, requeue=requeue_fallo)
+
+        metrics["total_processing_time"] += time.perf_counter() - start
+        return ok
+
+    def vaciar_si_vencido(self, canal):
+        """Los lotes incompletos se escriben tras timeout_lote segundos."""
+        if self.lote_tags and time.time() - self.lote_inicio >= self.timeout_lote:
+            self.vaciar(canal)
+
+    def drenar(self, canal, plazo):
+        """
+        Cierre ordenado con el consumo ya cancelado: escribe el lote
+        pendiente sin superar `plazo` (time.monotonic, lo recibe el
+        sumidero) y confirma solo lo escrito; si falla o no hay tiempo, lo
+        devuelve a la cola.
+
+        Devuelve (en_vuelo, escritos, reencolados).
+        """
+        self.drenando = True
+        en_vuelo = len(self.lote_tags)
+        escritos = 0
+        if en_vuelo:
+            if time.monotonic() < plazo:
+                if self.vaciar(canal, requeue_fallo=True, plazo=plazo):
+                    escritos = en_vuelo
+            else:
+                canal.basic_nack(delivery_tag=self.lote_tags[-1], multiple=True, requeue=True)
+                self.descartar_pendientes()
+        reencolados = en_vuelo - escritos
+        self.metrics["requeued"] += reencolados
+        return en_vuelo, escritos, reencolados
+
+    def descartar_pendientes(self):
+        """Olvida el lote al caer el canal: el broker reentrega sin ack."""
+        self.lote_tags.clear()
+        self.lote_lecturas.clear()
+        self.lote_exceso.descartar()
+
+    def log_metrics(self):
+        metrics = self.metrics
+        now = time.time()
+        elapsed = now - metrics["start_time"]
+        if elapsed <= 0:
+            elapsed = 1
+
+        msg_per_sec = metrics["messages_received"] / elapsed
+        avg_proc_time = (
+            metrics["total_processing_time"] / metrics["messages_received"]
+            if metrics["messages_received"] > 0 else 0
+        )
+        ttfm = metrics["time_to_first_message"]
+        ttfm_txt = f"{ttfm:.3f}s" if ttfm is not None else "-"
+
+        logger.info(
+            f"[MÉTRICAS {self.etiqueta}] "
+            f"msgs_recibidos={metrics['messages_received']} | "
+            f"msg/s={msg_per_sec:.3f} | "
+            f"tiempo_promedio_proc={avg_proc_time:.5f}s | "
+            f"db_ok={metrics['db_ok']} | "
+            f"db_errores={metrics['db_errors']} | "
+            f"json_errores={metrics['json_errors']} | "
+            f"anomalias={metrics['anomalies']} | "
+            f"lotes={metrics['batches']} | "
+            f"limitadas={metrics['throttled']} {metrics['throttled_by_station']} | "
+            f"descartadas={metrics['shed']} {metrics['shed_by_station']} | "
+            f"reencoladas={metrics['requeued']} | "
+            f"ttfm={ttfm_txt} | "
+            f"tiempo_total={elapsed:.1f}s"
+        )
+
+        metrics["last_log"] = now
+
+
+def instalar_parada():
+    """
+    Devuelve un Event que SIGTERM y SIGINT activan. Las fuentes lo revisan
+    en su temporizador de lotes y drenan desde el propio bucle de pika: el
+    manejador no toca el broker ni PostgreSQL.
+    """
+    import signal
+    import threading
+
+    parada = threading.Event()
+
+    def al_recibir(_signum, _frame):
+        parada.set()
+
+    signal.signal(signal.SIGTERM, al_recibir)
+    signal.signal(signal.SIGINT, al_recibir)
+    return parada
+
+
+def drenar_carriles(activos, plazo_drenado):
+    """Drena cada (pipeline, canal) con un plazo común y registra los totales."""
+    plazo = time.monotonic() + plazo_drenado
+    totales = [0, 0, 0]
+    for pipeline_c, channel in activos:
+        for i, n in enumerate(pipeline_c.drenar(channel, plazo)):
+            totales[i] += n
+        pipeline_c.log_metrics()
+    logger.info(
+        "[DRENADO] en_vuelo=%d | escritos=%d | reencolados=%d", *totales
+    )
+    return totales
+
+
+def esperar_dependencias(dependencias, parada=None, intervalo=0.2):
+    """
+    Espera los futures de `dependencias` revisando `parada` cada
+    `intervalo` segundos. Devuelve False si llegó una señal antes de que
+    terminaran; si terminaron, propaga sus excepciones.
+    """
+    from concurrent.futures import wait
+
+    pendientes = set(dependencias)
+    while pendientes:
+        if parada is not None and parada.is_set():
+            return False
+        _, pendientes = wait(pendientes, timeout=intervalo)
+    for dependencia in dependencias:
+        dependencia.result()
+    return True
+
+
+def _esperar_reintento(parada, segundos):
+    """Pausa entre reintentos; devuelve True si llegó una señal de parada."""
+    if parada is None:
+        time.sleep(segundos)
+        return False
+    return parada.wait(segundos)
+
+
+def parametros_conexion(host):
+    import pika
+
+    return pika.ConnectionParameters(
+        host=host,
+        connection_attempts=5,
+        retry_delay=2
+    )
+
+
+def carriles(pipeline, cola, prioridad=None):
+    """
+    Carriles de consumo como (pipeline, cola, rutas). `prioridad` es
+    (pipeline, cola) del carril de estaciones críticas: su cola no comparte
+    backlog con la general y su lote suele ser de 1 mensaje. Sin carril
+    prioritario, la cola general recibe también RUTA_CRITICAS.
+    """
+    if prioridad is None:
+        return [(pipeline, cola, RUTAS_GENERAL)]
+    pipeline_p, cola_p = prioridad
+    return [
+        (pipeline, cola, (RUTA_ESTACIONES,)),
+        (pipeline_p, cola_p, (RUTA_CRITICAS,)),
+    ]
+
+
+def consumir_bloqueante(pipeline, host, cola, max_retries=5,
+                        fast_start=False, dependencias=(), prioridad=None,
+                        parada=None, plazo_drenado=PLAZO_DRENADO):
+    """
+    Fuente bloqueante: BlockingConnection + start_consuming.
+
+    `dependencias` son futures (p. ej. la conexión a PostgreSQL abierta en
+    paralelo) que deben terminar antes de empezar a consumir. Cada carril
+    (ver carriles()) usa su propio canal: los delivery tags y el prefetch
+    son por canal. Con `parada` activada, el temporizador de lotes drena y
+    start_consuming termina sin reintentos.
+    """
+    import pika
+
+    retry = 0
+    lanes = carriles(pipeline, cola, prioridad)
+    for pipeline_c, _, _ in lanes:
+        pipeline_c.parada = parada
+
+    while retry < max_retries:
+        try:
+            connection = pika.BlockingConnection(parametros_conexion(host))
+            activos = [
+                (pipeline_c, preparar_canal(connection, cola_c, fast_start, rutas))
+                for pipeline_c, cola_c, rutas in lanes
+            ]
+
+            if not esperar_dependencias(dependencias, parada):
+                connection.close()
+                logger.info("Parada solicitada antes de empezar a consumir")
+                return
+
+            for (pipeline_c, channel), (_, cola_c, _) in zip(activos, lanes):
+                channel.basic_qos(prefetch_count=pipeline_c.tamano_lote)
+                channel.basic_consume(
+                    queue=cola_c,
+                    on_message_callback=pipeline_c.callback,
+                    auto_ack=False
+                )
+
+            intervalo = min(pipeline_c.timeout_lote for pipeline_c, _ in activos)
+
+            def vaciar_por_tiempo():
+                if parada is not None and parada.is_set():
+                    # stop_consuming cancela el consumo y rechaza (con
+                    # requeue) lo recibido que aún no llegó al callback
+                    for pipeline_c, channel in activos:
+                        pipeline_c.drenando = True
+                        channel.stop_consuming()
+                    drenar_carriles(activos, plazo_drenado)
+                    return
+                for pipeline_c, channel in activos:
+                    pipeline_c.vaciar_si_vencido(channel)
+                connection.call_later(intervalo, vaciar_por_tiempo)
+
+            connection.call_later(intervalo, vaciar_por_tiempo)
+
+            logger.info("Esperando mensajes (%s, fuente bloqueante)...", pipeline.etiqueta)
+            # start_consuming de cualquier canal atiende todos los de la conexión
+            activos[0][1].start_consuming()
+
+            if parada is not None and parada.is_set():
+                for _, channel in activos:
+                    channel.close()
+                connection.close()
+                logger.info("Consumidor detenido tras drenar (%s)", pipeline.etiqueta)
+                return
+
+        except Exception as e:
+            logger.error(f"Error en consumidor: {e}")
+            for pipeline_c, _, _ in lanes:
+                pipeline_c.descartar_pendientes()
+            retry += 1
+            if retry < max_retries:
+                logger.info(f"Reintentando en 5 segundos... ({retry}/{max_retries})")
+                if _esperar_reintento(parada, 5):
+                    return
+
+    logger.error(f"Máximo de reintentos alcanzado ({max_retries})")
+
+
+def consumir_async(pipeline, host, cola, max_retries=5,
+                   fast_start=False, dependencias=(), prioridad=None,
+                   parada=None, plazo_drenado=PLAZO_DRENADO):
+    """
+    Fuente asíncrona: SelectConnection con callbacks sobre su ioloop. El
+    carril prioritario, si lo hay, abre su propio canal una vez que el
+    carril general está consumiendo. Con `parada` activada, el temporizador
+    del carril general cancela ambos consumos, drena y cierra la conexión.
+    """
+    import pika
+
+    retry = 0
+    lanes = carriles(pipeline, cola, prioridad)
+    for pipeline_c, _, _ in lanes:
+        pipeline_c.parada = parada
+    rutas = lanes[0][2]
+    # Con fast_start la comprobación pasiva se intenta una sola vez
+    estado = {"verificando": False, "verificada": not fast_start, "detenido": False}
+
+    while retry < max_retries:
+        # (pipeline, canal, consumer_tag) de los carriles ya consumiendo
+        consumos = []
+
+        def on_open(connection):
+            connection.channel(on_open_callback=on_channel_open)
+
+        def on_channel_open(channel):
+            channel.add_on_close_callback(on_channel_closed)
+            if not estado["verificada"]:
+                estado["verificando"] = True
+                declarar_topologia_async(
+                    channel, cola, lambda: on_topologia(channel),
+                    pasos=topologia_pasiva(cola, rutas)
+                )
+            else:
+                declarar_topologia_async(
+                    channel, cola, lambda: on_topologia(channel),
+                    pasos=topologia(cola, rutas)
+                )
+
+        def on_topologia(channel):
+            if estado["verificando"]:
+                logger.info("Topología existente, se omite la declaración")
+            estado["verificando"] = False
+            estado["verificada"] = True
+            cuando_listas(lambda: channel.basic_qos(
+                prefetch_count=pipeline.tamano_lote,
+                callback=lambda _frame: iniciar_consumo(channel)
+            ))
+
+        def cuando_listas(accion):
+            # Sondea las dependencias sin bloquear el ioloop
+            if parada is not None and parada.is_set():
+                logger.info("Parada solicitada antes de empezar a consumir")
+                detener()
+            elif all(dependencia.done() for dependencia in dependencias):
+                for dependencia in dependencias:
+                    dependencia.result()
+                accion()
+            else:
+                connection.ioloop.call_later(0.05, lambda: cuando_listas(accion))
+
+        def iniciar_consumo(channel):
+            consumer_tag = channel.basic_consume(
+                queue=cola,
+                on_message_callback=pipeline.callback,
+                auto_ack=False
+            )
+            consumos.append((pipeline, channel, consumer_tag))
+
+            def vaciar_por_tiempo():
+                if not channel.is_open:
+                    return
+                if parada is not None and parada.is_set():
+                    detener()
+                    return
+                pipeline.vaciar_si_vencido(channel)
+                connection.ioloop.call_later(pipeline.timeout_lote, vaciar_por_tiempo)
+
+            connection.ioloop.call_later(pipeline.timeout_lote, vaciar_por_tiempo)
+            logger.info("Esperando mensajes (%s, fuente async)...", pipeline.etiqueta)
+
+            if prioridad is not None:
+                connection.channel(on_open_callback=on_canal_prioritario)
+
+        def on_canal_prioritario(channel):
+            pipeline_p, cola_p = prioridad
+            channel.add_on_close_callback(on_channel_closed)
+            declarar_topologia_async(
+                channel, cola_p, lambda: channel.basic_qos(
+                    prefetch_count=pipeline_p.tamano_lote,
+                    callback=lambda _frame: iniciar_prioritario(channel)
+                ),
+                pasos=topologia(cola_p, (RUTA_CRITICAS,))
+            )
+
+        def iniciar_prioritario(channel):
+            pipeline_p, cola_p = prioridad
+            consumer_tag = channel.basic_consume(
+                queue=cola_p,
+                on_message_callback=pipeline_p.callback,
+                auto_ack=False
+            )
+            consumos.append((pipeline_p, channel, consumer_tag))
+
+            def vaciar_por_tiempo():
+                if channel.is_open and not pipeline_p.drenando:
+                    pipeline_p.vaciar_si_vencido(channel)
+                    connection.ioloop.call_later(pipeline_p.timeout_lote, vaciar_por_tiempo)
+
+            connection.ioloop.call_later(pipeline_p.timeout_lote, vaciar_por_tiempo)
+            logger.info("Carril prioritario activo (%s)", cola_p)
+
+        def detener():
+            # Lo que llegue entre basic_cancel y el cierre vuelve a la cola
+            # (Pipeline.drenando); close() cierra los canales y luego la conexión
+            for pipeline_c, channel, consumer_tag in consumos:
+                pipeline_c.drenando = True
+                channel.basic_cancel(consumer_tag)
+            drenar_carriles([(p, c) for p, c, _ in consumos], plazo_drenado)
+            estado["detenido"] = True
+            connection.close()
+
+        def on_channel_closed(channel, reason):
+            if estado["detenido"]:
+                return
+            if estado["verificando"] and getattr(reason, "reply_code", None) == 404:
+                # Falta la topología: otro canal y declaración completa
+                logger.info(f"Topología incompleta ({reason}), declarando")
+                estado["verificando"] = False
+                estado["verificada"] = True
+                connection.channel(on_open_callback=on_channel_open)
+                return
+            logger.error(f"Canal cerrado: {reason}")
+            if connection.is_open:
+                connection.close()
+
+        def on_open_error(connection, error):
+            logger.error(f"Error en consumidor: {error}")
+            connection.ioloop.stop()
+
+        def on_closed(connection, reason):
+            if estado["detenido"]:
+                logger.info("Consumidor detenido tras drenar (%s)", pipeline.etiqueta)
+            else:
+                logger.error(f"Conexión cerrada: {reason}")
+            connection.ioloop.stop()
+
+        connection = pika.SelectConnection(
+            parametros_conexion(host),
+            on_open_callback=on_open,
+            on_open_error_callback=on_open_error,
+            on_close_callback=on_closed,
+        )
+        connection.ioloop.start()
+
+        if estado["detenido"]:
+            return
+        pipeline.descartar_pendientes()
+        if prioridad is not None:
+            prioridad[0].descartar_pendientes()
+        retry += 1
+        if retry < max_retries:
+            logger.info(f"Reintentando en 5 segundos... ({retry}/{max_retries})")
+            if _esperar_reintento(parada, 5):
+                return
+
+    logger.error(f"Máximo de reintentos alcanzado ({max_retries})")
+
+
+FUENTES = {
+    "blocking": consumir_bloqueante,
+    "async": consumir_async,
+}
@@ -0,0 +1,42 @@
+class Lectura:
+    """
+    Lectura meteorológica tipada, compartida desde la decodificación hasta
+    la escritura en BD. Usa __slots__: sin __dict__ por instancia.
+    """
+
+    __slots__ = ("estacion_id", "temperatura", "humedad", "fecha")
+
+    def __init__(self, estacion_id, temperatura, humedad, fecha):
+        self.estacion_id = estacion_id
+        self.temperatura = temperatura
+        self.humedad = humedad
+        self.fecha = fecha
+
+    @classmethod
+    def desde_dict(cls, data):
+        return cls(data["estacion_id"], data["temperatura"],
+                   data["humedad"], data["fecha"])
+
+    def como_fila(self):
+        """Tupla en el orden de columnas de weather_logs."""
+        return (self.estacion_id, self.temperatura, self.humedad, self.fecha)
+
+    def como_dict(self):
+        return {
+            "estacion_id": self.estacion_id,
+            "temperatura": self.temperatura,
+            "humedad": self.humedad,
+            "fecha": self.fecha,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Lectura):
+            return NotImplemented
+        return self.como_fila() == other.como_fila()
+
+    def __repr__(self):
+        return (
+            f"Lectura(estacion_id={self.estacion_id!r}, "
+            f"temperatura={self.temperatura!r}, humedad={self.humedad!r}, "
+            f"fecha={self.fecha!r})"
+        )
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+
+class LimitadorEstaciones:
+    """
+    Token bucket por estación: `tasa` mensajes/s con ráfagas de hasta
+    `rafaga`. permitir() es O(1): un acceso al dict y aritmética, sin
+    timers ni colas por estación.
+    """
+
+    def __init__(self, tasa, rafaga):
+        self.tasa = float(tasa)
+        self.rafaga = float(max(1, rafaga))
+        # estacion_id -> [tokens, último instante]
+        self._cubos = {}
+
+    def permitir(self, estacion_id, ahora):
+        """`ahora` debe venir de un reloj monótono (time.perf_counter)."""
+        cubo = self._cubos.get(estacion_id)
+        if cubo is None:
+            self._cubos[estacion_id] = [self.rafaga - 1.0, ahora]
+            return True
+
+        tokens = cubo[0] + (ahora - cubo[1]) * self.tasa
+        if tokens > self.rafaga:
+            tokens = self.rafaga
+        cubo[1] = ahora
+        if tokens >= 1.0:
+            cubo[0] = tokens - 1.0
+            return True
+        cubo[0] = tokens
+        return False
+
+
+def minuto_de(fecha):
+    """Inicio del minuto de una fecha ISO (clave del resumen por estación)."""
+    return datetime.fromisoformat(fecha).replace(second=0, microsecond=0)
+
+
+class AgregadorExceso:
+    """
+    Acumula las lecturas que exceden el límite en resúmenes por
+    (estación, minuto): muestras y sumas de temperatura y humedad. Se
+    escriben con un upsert a weather_logs_rollup en el mismo lote.
+    """
+
+    def __init__(self):
+        # (estacion_id, minuto) -> [muestras, suma_temperatura, suma_humedad]
+        self._resumenes = {}
+
+    def __len__(self):
+        return len(self._resumenes)
+
+    def agregar(self, lectura):
+        """Devuelve False si la fecha no se puede interpretar."""
+        try:
+            clave = (lectura.estacion_id, minuto_de(lectura.fecha))
+        except (TypeError, ValueError):
+            return False
+        resumen = self._resumenes.get(clave)
+        if resumen is None:
+            self._resumenes[clave] = [1, lectura.temperatura, lectura.humedad]
+        else:
+            resumen[0] += 1
+            resumen[1] += lectura.temperatura
+            resumen[2] += lectura.humedad
+        return True
+
+    def extraer(self):
+        """Devuelve las filas (estacion_id, minuto, muestras, suma_t, suma_h) y vacía."""
+        filas = [clave + tuple(valores) for clave, valores in self._resumenes.items()]
+        self._resumenes.clear()
+        return filas
+
+    def descartar(self):
+        self._resumenes.clear()
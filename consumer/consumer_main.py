@@ -1,11 +1,16 @@
-import os
 import time
-import pika
+
+# Antes de cualquier importación pesada: base del tiempo hasta el primer mensaje
+T_ARRANQUE = time.time()
+
+import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 
-from consumer_bd import conectar_postgres, insertar_weather_log
-from consumer_validacion import validar_mensaje
+from consumer_bd import SUMIDEROS, conectar_postgres, cerrar_conexion
+from consumer_core import FUENTES, Pipeline, instalar_parada
+from consumer_limites import LimitadorEstaciones
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,141 +21,108 @@ logger = logging.getLogger(__name__)
 rabbitmq_host = os.getenv("RABBITMQ_HOST", "rabbitmq")
 rabbitmq_queue = os.getenv("RABBITMQ_QUEUE", "logs_queue")
 
-METRICS_INTERVAL = 30  
-
-metrics = {
-    "messages_received": 0,
-    "db_ok": 0,
-    "db_errors": 0,
-    "json_errors": 0,
-    "total_processing_time": 0.0,
-    "start_time": time.time(),
-    "last_log": time.time(),
-}
-
-def log_metrics():
-    now = time.time()
-    elapsed = now - metrics["start_time"]
-    if elapsed <= 0:
-        elapsed = 1
-
-    msg_per_sec = metrics["messages_received"] / elapsed
-    avg_proc_time = (
-        metrics["total_processing_time"] / metrics["messages_received"]
-        if metrics["messages_received"] > 0 else 0
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "50"))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", "1.0"))
+ANOMALY_DETECTION = os.getenv("ANOMALY_DETECTION", "1") == "1"
+
+# Log por mensaje: canal DEBUG muestreado (1 de cada LOG_SAMPLE_EVERY)
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "1000"))
+
+# Fuente: blocking | async. Sumidero: row | batch | copy | prepared
+CONSUMER_SOURCE = os.getenv("CONSUMER_SOURCE", "blocking")
+DB_SINK = os.getenv("DB_SINK", "batch")
+
+# Arranque rápido: comprobación pasiva de la topología y conexión a
+# PostgreSQL en paralelo con la de RabbitMQ
+FAST_START = os.getenv("FAST_START", "0") == "1"
+
+# Límite por estación (token bucket): RATE_LIMIT_PER_STATION msg/s con
+# ráfagas de RATE_LIMIT_BURST; 0 lo desactiva. El exceso se resume por
+# minuto (aggregate) o se descarta (shed)
+RATE_LIMIT_PER_STATION = float(os.getenv("RATE_LIMIT_PER_STATION", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "100"))
+RATE_LIMIT_MODE = os.getenv("RATE_LIMIT_MODE", "aggregate")
+
+# Carril prioritario: cola propia para station.<id>.critical, sin límite
+# y con lotes pequeños
+PRIORITY_LANE = os.getenv("PRIORITY_LANE", "0") == "1"
+PRIORITY_QUEUE = os.getenv("PRIORITY_QUEUE", "logs_queue_priority")
+PRIORITY_BATCH_SIZE = int(os.getenv("PRIORITY_BATCH_SIZE", "1"))
+
+# Cierre ordenado (SIGTERM/SIGINT): segundos para escribir los lotes
+# pendientes antes de devolverlos a la cola. Menor que el stop_grace_period
+# del contenedor (10 s por defecto en Docker)
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "5.0"))
+
+
+def crear_etapas():
+    etapas = []
+    if ANOMALY_DETECTION:
+        # NumPy solo se importa si la etapa está activa
+        from consumer_anomalias import EtapaAnomalias
+        etapas.append(EtapaAnomalias())
+    return etapas
+
+
+def crear_pipeline():
+    limitador = None
+    if RATE_LIMIT_PER_STATION > 0:
+        limitador = LimitadorEstaciones(RATE_LIMIT_PER_STATION, RATE_LIMIT_BURST)
+    return Pipeline(
+        sumidero=SUMIDEROS[DB_SINK],
+        etapas=crear_etapas(),
+        tamano_lote=BATCH_SIZE,
+        timeout_lote=BATCH_TIMEOUT,
+        etiqueta="CONSUMER DIVIDIDO",
+        log_sample_every=LOG_SAMPLE_EVERY,
+        t_arranque=T_ARRANQUE,
+        limitador=limitador,
+        modo_exceso=RATE_LIMIT_MODE,
     )
 
-    logger.info(
-        "[MÉTRICAS CONSUMER DIVIDIDO] "
-        f"msgs_recibidos={metrics['messages_received']} | "
-        f"msg/s={msg_per_sec:.3f} | "
-        f"tiempo_promedio_proc={avg_proc_time:.5f}s | "
-        f"db_ok={metrics['db_ok']} | "
-        f"db_errores={metrics['db_errors']} | "
-        f"json_errores={metrics['json_errors']} | "
-        f"tiempo_total={elapsed:.1f}s"
-    )
-
-    metrics["last_log"] = now
-
-
-def callback(ch, method, properties, body):
-    start = time.perf_counter()
-    metrics["messages_received"] += 1
-
-    data, error = validar_mensaje(body)
-
-    if error is not None:
-        metrics["json_errors"] += 1
-        logger.warning(f"Mensaje inválido, descartar. Error: {error}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return
-
-  
-    ok = insertar_weather_log(data)
-
-    if ok:
-        metrics["db_ok"] += 1
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-    else:
-        metrics["db_errors"] += 1
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-
-    elapsed = time.perf_counter() - start
-    metrics["total_processing_time"] += elapsed
-
-    now = time.time()
-    if now - metrics["last_log"] >= METRICS_INTERVAL:
-        log_metrics()
-
-
-def consumir():
-    max_retries = 5
-    retry = 0
 
-    while retry < max_retries:
-        try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=rabbitmq_host,
-                    connection_attempts=5,
-                    retry_delay=2
-                )
-            )
-            channel = connection.channel()
-
-            channel.exchange_declare(
-                exchange='weather.data',
-                exchange_type='topic',
-                durable=True
-            )
-            channel.exchange_declare(
-                exchange='weather.dlx',
-                exchange_type='fanout',
-                durable=True
-            )
-
-            args = {
-                'x-dead-letter-exchange': 'weather.dlx'
-            }
-
-            channel.queue_declare(
-                queue=rabbitmq_queue,
-                durable=True,
-                arguments=args
-            )
-            channel.queue_bind(
-                queue=rabbitmq_queue,
-                exchange='weather.data',
-                routing_key='station.*'
-            )
-
-            channel.queue_declare(queue='logs_dlx', durable=True)
-            channel.queue_bind(queue='logs_dlx', exchange='weather.dlx')
-
-            channel.basic_qos(prefetch_count=1)
-            channel.basic_consume(
-                queue=rabbitmq_queue,
-                on_message_callback=callback,
-                auto_ack=False
-            )
-
-            logger.info("Esperando mensajes (consumer_main.py)...")
-            channel.start_consuming()
-
-        except Exception as e:
-            logger.error(f"Error en consumidor: {e}")
-            retry += 1
-            if retry < max_retries:
-                logger.info(f"Reintentando en 5 segundos... ({retry}/{max_retries})")
-                time.sleep(5)
-
-    logger.error(f"Máximo de reintentos alcanzado ({max_retries})")
+def crear_prioridad():
+    """(Pipeline, cola) del carril prioritario, o None si está desactivado."""
+    if not PRIORITY_LANE:
+        return None
+    pipeline = Pipeline(
+        sumidero=SUMIDEROS[DB_SINK],
+        etapas=crear_etapas(),
+        tamano_lote=PRIORITY_BATCH_SIZE,
+        timeout_lote=BATCH_TIMEOUT,
+        etiqueta="CONSUMER PRIORITARIO",
+        log_sample_every=LOG_SAMPLE_EVERY,
+        t_arranque=T_ARRANQUE,
+    )
+    return pipeline, PRIORITY_QUEUE
 
 
 if __name__ == "__main__":
+    # Desde el principio: la espera a PostgreSQL también atiende SIGTERM
+    parada = instalar_parada()
+    ejecutor = None
     try:
-        conectar_postgres()   
-        consumir()              
-    except KeyboardInterrupt:
-        logger.info("Consumidor dividido detenido por el usuario")
+        dependencias = []
+        if FAST_START:
+            ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="arranque-bd")
+            dependencias.append(ejecutor.submit(conectar_postgres, parada))
+        else:
+            conectar_postgres(parada)
+
+        if not parada.is_set():
+            FUENTES[CONSUMER_SOURCE](
+                crear_pipeline(),
+                rabbitmq_host,
+                rabbitmq_queue,
+                fast_start=FAST_START,
+                dependencias=dependencias,
+                prioridad=crear_prioridad(),
+                parada=parada,
+                plazo_drenado=DRAIN_TIMEOUT,
+            )
+        logger.info("Consumidor dividido detenido")
+    finally:
+        if ejecutor is not None:
+            # conectar_postgres deja de reintentar con la parada activada
+            ejecutor.shutdown(wait=False, cancel_futures=True)
+        cerrar_conexion()
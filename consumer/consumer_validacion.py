@@ -1,20 +1,67 @@
 import json
 import logging
+import math
+from datetime import datetime
+
+from consumer_lectura import Lectura
 
 logger = logging.getLogger(__name__)
 
 CAMPOS_REQUERIDOS = ["estacion_id", "temperatura", "humedad", "fecha"]
+CAMPOS_NUMERICOS = ["temperatura", "humedad"]
+
+# estacion_id es INT en PostgreSQL (INT4)
+ESTACION_MAXIMA = 2**31 - 1
+
+
+def _es_numero_finito(valor):
+    """int/float finito; json.loads acepta NaN e Infinity."""
+    if not isinstance(valor, (int, float)) or isinstance(valor, bool):
+        return False
+    try:
+        return math.isfinite(valor)
+    except OverflowError:
+        return False
+
+
+def _es_fecha_valida(valor):
+    if not isinstance(valor, str):
+        return False
+    try:
+        datetime.fromisoformat(valor)
+    except ValueError:
+        return False
+    return True
+
 
 def validar_mensaje(body):
-    
+    """Decodifica y valida el mensaje. Devuelve (Lectura, None) o (None, error)."""
     try:
         data = json.loads(body)
-    except json.JSONDecodeError as e:
+    except (ValueError, UnicodeDecodeError) as e:
+        # JSONDecodeError y bytes que no son UTF-8 válido
         logger.error(f"Error decodificando JSON: {e}")
         return None, "json_error"
 
+    if not isinstance(data, dict):
+        logger.warning(f"El mensaje no es un objeto JSON: {data!r}")
+        return None, "no_es_objeto"
+
     if not all(campo in data for campo in CAMPOS_REQUERIDOS):
         logger.warning(f"Datos incompletos: {data}")
         return None, "campos_incompletos"
 
-    return data, None
+    estacion_id = data["estacion_id"]
+    if (
+        not isinstance(estacion_id, int) or isinstance(estacion_id, bool)
+        or not 0 < estacion_id <= ESTACION_MAXIMA
+        or not all(_es_numero_finito(data[campo]) for campo in CAMPOS_NUMERICOS)
+    ):
+        logger.warning(f"Tipos inválidos: {data}")
+        return None, "tipos_invalidos"
+
+    if not _es_fecha_valida(data["fecha"]):
+        logger.warning(f"Fecha inválida: {data}")
+        return None, "fecha_invalida"
+
+    return Lectura.desde_dict(data), None
@@ -20,3 +20,28 @@ CREATE TABLE IF NOT EXISTS weather_logs_errors (
     received_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+
+-- Lecturas marcadas por el detector de anomalías del consumer
+-- (DOUBLE PRECISION: los valores anómalos pueden violar los CHECK de weather_logs)
+CREATE TABLE IF NOT EXISTS weather_logs_anomalias (
+    id SERIAL PRIMARY KEY,
+    estacion_id INT NOT NULL,
+    temperatura DOUBLE PRECISION NOT NULL,
+    humedad DOUBLE PRECISION NOT NULL,
+    fecha TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    motivo TEXT NOT NULL,
+    detectado_en TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_weather_logs_anomalias_estacion_fecha ON weather_logs_anomalias (estacion_id, fecha);
+
+-- Resúmenes por estación y minuto de las lecturas que exceden el límite
+-- por estación del consumer (RATE_LIMIT_MODE=aggregate)
+CREATE TABLE IF NOT EXISTS weather_logs_rollup (
+    estacion_id INT NOT NULL,
+    minuto TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    muestras INT NOT NULL,
+    suma_temperatura DOUBLE PRECISION NOT NULL,
+    suma_humedad DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (estacion_id, minuto)
+);
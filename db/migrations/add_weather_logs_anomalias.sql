@@ -0,0 +1,14 @@
+-- Migration: tabla de lecturas anómalas desviadas por el consumer
+-- Safe script: idempotente, se puede ejecutar varias veces
+
+CREATE TABLE IF NOT EXISTS weather_logs_anomalias (
+    id SERIAL PRIMARY KEY,
+    estacion_id INT NOT NULL,
+    temperatura DOUBLE PRECISION NOT NULL,
+    humedad DOUBLE PRECISION NOT NULL,
+    fecha TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    motivo TEXT NOT NULL,
+    detectado_en TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_weather_logs_anomalias_estacion_fecha ON weather_logs_anomalias (estacion_id, fecha);
@@ -0,0 +1,11 @@
+-- Migration: resúmenes por minuto de las lecturas limitadas por el consumer
+-- Safe script: idempotente, se puede ejecutar varias veces
+
+CREATE TABLE IF NOT EXISTS weather_logs_rollup (
+    estacion_id INT NOT NULL,
+    minuto TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    muestras INT NOT NULL,
+    suma_temperatura DOUBLE PRECISION NOT NULL,
+    suma_humedad DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (estacion_id, minuto)
+);
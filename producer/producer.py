@@ -1,11 +1,18 @@
+import time
+
+# Base del tiempo hasta la primera publicación
+T_ARRANQUE = time.time()
+
 import pika
 import json
-import time
 import random
 from datetime import datetime
 import os
 import logging
+import signal
+import threading
 
+from producer_compresion import algoritmo_disponible, comprimir
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,9 +28,43 @@ TEMP_MIN, TEMP_MAX = 15, 35
 HUMIDITY_MIN, HUMIDITY_MAX = 40, 90
 STATION_MIN, STATION_MAX = 1, 5
 
+# Compresión opcional del payload: none | zlib | zstd (con diccionario
+# compartido). Mensajes por debajo de COMPRESSION_MIN_BYTES van sin comprimir.
+COMPRESSION = algoritmo_disponible(os.getenv("COMPRESSION", "none"))
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "64"))
+
+# Arranque rápido: si el exchange ya existe (declaración pasiva) no se redeclara
+FAST_START = os.getenv("FAST_START", "0") == "1"
+
+# Estaciones críticas ("1,3"): se publican como station.<id>.critical hacia
+# el carril prioritario del consumer (PRIORITY_LANE=1); sin carril, el
+# consumer enlaza esa ruta a la cola general
+CRITICAL_STATIONS = frozenset(
+    int(e) for e in os.getenv("CRITICAL_STATIONS", "").split(",") if e.strip()
+)
+
 
 METRICS_INTERVAL = 30  
 
+# SIGTERM/SIGINT la activan: el bucle termina el mensaje en curso y cierra
+# canal y conexión en lugar de cortarse a mitad de una publicación
+parada = threading.Event()
+
+
+def instalar_parada():
+    def al_recibir(_signum, _frame):
+        parada.set()
+
+    signal.signal(signal.SIGTERM, al_recibir)
+    signal.signal(signal.SIGINT, al_recibir)
+
+
+def ruta_estacion(estacion_id):
+    if estacion_id in CRITICAL_STATIONS:
+        return f"station.{estacion_id}.critical"
+    return f"station.{estacion_id}"
+
+
 metrics = {
     "messages_sent": 0,
     "validation_errors": 0,
@@ -31,6 +72,9 @@ metrics = {
     "connection_errors": 0,
     "retries": 0,
     "total_publish_time": 0.0,
+    "bytes_raw": 0,
+    "bytes_sent": 0,
+    "time_to_first_publish": None,
     "start_time": time.time(),
     "last_metrics_log": time.time(),
 }
@@ -55,7 +99,8 @@ def log_metrics():
             "[MÉTRICAS PRODUCER] msgs_enviados=%d | msg/s=%.2f | "
             "tiempo_promedio_publicación=%.4fs | "
             "errores_validación=%d | errores_publicación=%d | "
-            "errores_conexión=%d | reintentos=%d | tiempo_total=%.1fs"
+            "errores_conexión=%d | reintentos=%d | "
+            "bytes_enviados=%d | ratio_compresión=%.2f | tiempo_total=%.1fs"
         ),
         metrics["messages_sent"],
         msg_per_second,
@@ -64,6 +109,8 @@ def log_metrics():
         metrics["publish_errors"],
         metrics["connection_errors"],
         metrics["retries"],
+        metrics["bytes_sent"],
+        metrics["bytes_sent"] / metrics["bytes_raw"] if metrics["bytes_raw"] else 1.0,
         elapsed,
     )
 
@@ -81,12 +128,31 @@ def validar_datos(estacion_id, temperatura, humedad):
     return True
 
 
+def preparar_canal(connection):
+    """Abre el canal y declara el exchange (solo si falta, con FAST_START)."""
+    channel = connection.channel()
+    if FAST_START:
+        try:
+            channel.exchange_declare(exchange='weather.data', passive=True)
+            return channel
+        except pika.exceptions.ChannelClosedByBroker:
+            # 404: el broker cerró el canal, se abre otro y se declara
+            channel = connection.channel()
+
+    channel.exchange_declare(
+        exchange='weather.data',
+        exchange_type='topic',
+        durable=True
+    )
+    return channel
+
+
 def publicar_datos():
     """Publica datos meteorológicos a RabbitMQ."""
     max_retries = 5
     retry = 0
 
-    while retry < max_retries:
+    while retry < max_retries and not parada.is_set():
         try:
             connection = pika.BlockingConnection(
                 pika.ConnectionParameters(
@@ -95,18 +161,12 @@ def publicar_datos():
                     retry_delay=2
                 )
             )
-            channel = connection.channel()
-
-            channel.exchange_declare(
-                exchange='weather.data',
-                exchange_type='topic',
-                durable=True
-            )
+            channel = preparar_canal(connection)
 
             logger.info("Conectado a RabbitMQ")
             retry = 0  
 
-            while True:
+            while not parada.is_set():
                 try:
                     estacion_id = random.randint(STATION_MIN, STATION_MAX)
                     temperatura = round(random.uniform(TEMP_MIN, TEMP_MAX), 2)
@@ -118,7 +178,7 @@ def publicar_datos():
                     except ValueError as ve:
                         metrics["validation_errors"] += 1
                         logger.warning(f"Datos inválidos: {ve}")
-                        time.sleep(1)
+                        parada.wait(1)
                         continue  # no publicamos este mensaje
 
                     log = {
@@ -128,20 +188,40 @@ def publicar_datos():
                         "fecha": datetime.now().isoformat()
                     }
 
-                    routing_key = f"station.{estacion_id}"
+                    routing_key = ruta_estacion(estacion_id)
 
                    
                     t0 = time.perf_counter()
+                    raw = json.dumps(log).encode()
+                    body, content_encoding = comprimir(
+                        raw, COMPRESSION, COMPRESSION_MIN_BYTES
+                    )
+                    ahora = time.time()
                     channel.basic_publish(
                         exchange='weather.data',
                         routing_key=routing_key,
-                        body=json.dumps(log),
-                        properties=pika.BasicProperties(delivery_mode=2)
+                        body=body,
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,
+                            content_type="application/json",
+                            content_encoding=content_encoding,
+                            timestamp=int(ahora),
+                            # Resolución sub-segundo para producer_replay.py
+                            headers={"ts": ahora}
+                        )
                     )
                     publish_time = time.perf_counter() - t0
 
                     metrics["messages_sent"] += 1
                     metrics["total_publish_time"] += publish_time
+                    metrics["bytes_raw"] += len(raw)
+                    metrics["bytes_sent"] += len(body)
+                    if metrics["time_to_first_publish"] is None:
+                        metrics["time_to_first_publish"] = time.time() - T_ARRANQUE
+                        logger.info(
+                            "[ARRANQUE PRODUCER] primera publicación a los %.3fs",
+                            metrics["time_to_first_publish"]
+                        )
 
                     logger.info(
                         f"📤 Enviado: {log} (publish_time={publish_time:.5f}s)"
@@ -151,12 +231,23 @@ def publicar_datos():
                     if now - metrics["last_metrics_log"] >= METRICS_INTERVAL:
                         log_metrics()
 
-                    time.sleep(5)
+                    parada.wait(5)
 
                 except Exception as e:
                     metrics["publish_errors"] += 1
                     logger.error(f"Error generando/publicando datos: {e}")
-                    time.sleep(1)
+                    parada.wait(1)
+
+            # basic_publish ya escribió cada mensaje; close() vacía el
+            # buffer de salida antes de cerrar canal y conexión
+            channel.close()
+            connection.close()
+            logger.info(
+                "[CIERRE PRODUCER] canal y conexión cerrados | msgs_enviados=%d",
+                metrics["messages_sent"]
+            )
+            log_metrics()
+            return
 
         except Exception as e:
             metrics["connection_errors"] += 1
@@ -165,14 +256,16 @@ def publicar_datos():
             logger.error(f"Error de conexión a RabbitMQ: {e}")
             if retry < max_retries:
                 logger.info(f"Reintentando en 5 segundos... ({retry}/{max_retries})")
-                time.sleep(5)
+                parada.wait(5)
 
-    logger.error(f"Máximo de reintentos alcanzado ({max_retries})")
+    if not parada.is_set():
+        logger.error(f"Máximo de reintentos alcanzado ({max_retries})")
     log_metrics()  
 
 
 if __name__ == "__main__":
     try:
+        instalar_parada()
         publicar_datos()
     except KeyboardInterrupt:
         logger.info("Productor detenido por el usuario")
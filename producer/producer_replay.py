@@ -0,0 +1,299 @@
+"""
+Reproducción determinista de tráfico grabado hacia weather.data.
+
+Fuentes:
+  - Archivo JSONL (se lee línea a línea, sin cargarlo en memoria). Cada
+    línea es un registro grabado por `grabar` o una lectura del producer.
+  - Una cola (p. ej. logs_dlx): se consume hasta que queda inactiva y cada
+    mensaje se confirma solo después de republicarlo.
+
+Los mensajes se publican con los intervalos originales divididos por
+--velocidad (1, 10, ... o "max" para no esperar) en un único canal en modo
+confirm.
+
+Ojo al reproducir desde logs_dlx: lo que vuelva a fallar regresa a la misma
+cola, así que conviene acotar con --limite.
+
+Usar:
+  python3 producer_replay.py grabar --cola logs_dlx --salida captura.jsonl
+  python3 producer_replay.py reproducir --archivo captura.jsonl --velocidad 10
+  python3 producer_replay.py reproducir --cola logs_dlx --velocidad max
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import pika
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+rabbitmq_host = os.getenv("RABBITMQ_HOST", "rabbitmq")
+
+EXCHANGE_DATOS = "weather.data"
+# Cabecera con el instante de publicación en segundos con decimales
+# (properties.timestamp de AMQP solo tiene resolución de segundo)
+CABECERA_TS = "ts"
+INACTIVIDAD_COLA = 5.0
+LOG_CADA = 1000
+
+
+def conectar(host):
+    return pika.BlockingConnection(
+        pika.ConnectionParameters(
+            host=host,
+            connection_attempts=5,
+            retry_delay=2
+        )
+    )
+
+
+def _ts_desde_fecha(body):
+    """Marca de tiempo a partir del campo fecha de una lectura, si existe."""
+    try:
+        fecha = json.loads(body).get("fecha")
+        return datetime.fromisoformat(fecha).timestamp()
+    except Exception:
+        return None
+
+
+def registro_desde_linea(linea):
+    """
+    Convierte una línea JSONL en registro:
+    {"ts", "routing_key", "body" (bytes), "content_encoding"}.
+    """
+    data = json.loads(linea)
+
+    if "body" in data or "body_b64" in data:
+        if "body_b64" in data:
+            body = base64.b64decode(data["body_b64"])
+        else:
+            body = data["body"].encode()
+        ts = data.get("ts")
+        if ts is None and not data.get("content_encoding"):
+            ts = _ts_desde_fecha(body)
+        return {
+            "ts": ts,
+            "routing_key": data["routing_key"],
+            "body": body,
+            "content_encoding": data.get("content_encoding"),
+        }
+
+    # Lectura suelta, tal como la publica el producer
+    return {
+        "ts": _ts_desde_fecha(linea),
+        "routing_key": f"station.{data['estacion_id']}",
+        "body": json.dumps(data).encode(),
+        "content_encoding": None,
+    }
+
+
+def leer_jsonl(ruta):
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        for numero, linea in enumerate(archivo, start=1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                yield registro_desde_linea(linea)
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Línea {numero} ignorada: {e}")
+
+
+def registro_desde_mensaje(method, properties, body):
+    """
+    Tiempo del registro, de más a menos preciso: cabecera CABECERA_TS,
+    fecha de la lectura (solo sin comprimir) y properties.timestamp.
+    """
+    ts = (properties.headers or {}).get(CABECERA_TS)
+    if ts is None and not properties.content_encoding:
+        ts = _ts_desde_fecha(body)
+    if ts is None:
+        ts = properties.timestamp
+    return {
+        "ts": ts,
+        "routing_key": method.routing_key,
+        "body": body,
+        "content_encoding": properties.content_encoding,
+        "delivery_tag": method.delivery_tag,
+    }
+
+
+def leer_cola(channel, cola, limite=None):
+    """Consume la cola hasta INACTIVIDAD_COLA segundos sin mensajes."""
+    channel.basic_qos(prefetch_count=100)
+    leidos = 0
+    for method, properties, body in channel.consume(
+        cola, auto_ack=False, inactivity_timeout=INACTIVIDAD_COLA
+    ):
+        if method is None:
+            break
+        yield registro_desde_mensaje(method, properties, body)
+        leidos += 1
+        if limite is not None and leidos >= limite:
+            break
+    channel.cancel()
+
+
+def linea_desde_registro(registro):
+    linea = {
+        "ts": registro["ts"],
+        "routing_key": registro["routing_key"],
+        "content_encoding": registro["content_encoding"],
+    }
+    if registro["content_encoding"]:
+        linea["body_b64"] = base64.b64encode(registro["body"]).decode()
+    else:
+        linea["body"] = registro["body"].decode()
+    return json.dumps(linea)
+
+
+def grabar(channel, cola, ruta, limite=None):
+    """Vacía la cola a un archivo JSONL; confirma cada mensaje ya escrito."""
+    grabados = 0
+    with open(ruta, "a", encoding="utf-8") as archivo:
+        for registro in leer_cola(channel, cola, limite):
+            archivo.write(linea_desde_registro(registro) + "\n")
+            archivo.flush()
+            channel.basic_ack(delivery_tag=registro["delivery_tag"])
+            grabados += 1
+    logger.info(f"Grabados {grabados} mensajes de {cola} en {ruta}")
+    return grabados
+
+
+def reproducir(registros, channel, velocidad=1.0, al_publicar=None):
+    """
+    Publica los registros respetando sus intervalos originales / velocidad
+    (velocidad=None: sin esperas). `channel` debe estar en modo confirm.
+    """
+    stats = {"publicados": 0, "fallidos": 0, "retraso_max": 0.0}
+    t0_registro = None
+    t0 = time.perf_counter()
+
+    for registro in registros:
+        ts = registro["ts"]
+        if velocidad is not None and ts is not None:
+            if t0_registro is None:
+                t0_registro = ts
+            objetivo = (ts - t0_registro) / velocidad
+            espera = objetivo - (time.perf_counter() - t0)
+            if espera > 0:
+                # Duerme atendiendo la conexión: con time.sleep no se
+                # responden heartbeats y el broker corta en pausas largas
+                channel.connection.sleep(espera)
+            else:
+                stats["retraso_max"] = max(stats["retraso_max"], -espera)
+
+        try:
+            channel.basic_publish(
+                exchange=EXCHANGE_DATOS,
+                routing_key=registro["routing_key"],
+                body=registro["body"],
+                properties=pika.BasicProperties(
+                    delivery_mode=2,
+                    content_type="application/json",
+                    content_encoding=registro["content_encoding"],
+                    timestamp=int(ts) if ts is not None else None,
+                    headers={CABECERA_TS: ts} if ts is not None else None
+                ),
+                mandatory=True
+            )
+        except (pika.exceptions.UnroutableError, pika.exceptions.NackError) as e:
+            stats["fallidos"] += 1
+            logger.error(f"Mensaje no confirmado por el broker: {e}")
+            continue
+
+        stats["publicados"] += 1
+        if al_publicar is not None:
+            al_publicar(registro)
+        if stats["publicados"] % LOG_CADA == 0:
+            logger.info(f"Reproducidos {stats['publicados']} mensajes")
+
+    elapsed = time.perf_counter() - t0
+    stats["tiempo_total"] = elapsed
+    logger.info(
+        "[REPLAY] publicados=%d | fallidos=%d | msg/s=%.1f | "
+        "retraso_max=%.3fs | tiempo_total=%.1fs",
+        stats["publicados"],
+        stats["fallidos"],
+        stats["publicados"] / elapsed if elapsed > 0 else 0.0,
+        stats["retraso_max"],
+        elapsed,
+    )
+    return stats
+
+
+def parse_velocidad(valor):
+    if valor == "max":
+        return None
+    velocidad = float(valor)
+    if velocidad <= 0:
+        raise argparse.ArgumentTypeError("la velocidad debe ser > 0 o 'max'")
+    return velocidad
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default=rabbitmq_host)
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_grabar = sub.add_parser("grabar", help="vaciar una cola a JSONL")
+    p_grabar.add_argument("--cola", required=True)
+    p_grabar.add_argument("--salida", required=True)
+    p_grabar.add_argument("--limite", type=int)
+
+    p_repro = sub.add_parser("reproducir", help="republicar hacia weather.data")
+    fuente = p_repro.add_mutually_exclusive_group(required=True)
+    fuente.add_argument("--archivo")
+    fuente.add_argument("--cola")
+    p_repro.add_argument("--velocidad", type=parse_velocidad, default=1.0,
+                         help="factor de velocidad (1, 10, ...) o 'max'")
+    p_repro.add_argument("--limite", type=int)
+
+    args = parser.parse_args(argv)
+
+    connection = conectar(args.host)
+    try:
+        if args.comando == "grabar":
+            grabar(connection.channel(), args.cola, args.salida, args.limite)
+            return 0
+
+        publicacion = connection.channel()
+        publicacion.confirm_delivery()
+
+        if args.archivo:
+            registros = leer_jsonl(args.archivo)
+            if args.limite is not None:
+                registros = itertools.islice(registros, args.limite)
+            stats = reproducir(registros, publicacion, args.velocidad)
+        else:
+            lectura = connection.channel()
+            stats = reproducir(
+                leer_cola(lectura, args.cola, args.limite),
+                publicacion,
+                args.velocidad,
+                al_publicar=lambda r: lectura.basic_ack(delivery_tag=r["delivery_tag"]),
+            )
+        return 0 if stats["fallidos"] == 0 else 1
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        logger.info("Replay detenido por el usuario")
+    except pika.exceptions.AMQPConnectionError as e:
+        logger.error(f"Conexión con RabbitMQ perdida: {e!r}")
+        sys.exit(1)
@@ -194,16 +194,25 @@ class TestEdgeCases:
             validar_datos(1, 25.0, 100.0)
 
 
+# Datos válidos compartidos por el fixture y cuerpo_mensaje
+DATOS_VALIDOS = {
+    "estacion_id": 3,
+    "temperatura": 22.5,
+    "humedad": 60.0,
+    "fecha": "2025-11-11T12:30:45.123456"
+}
+
+
 # Fixture para datos válidos
 @pytest.fixture
 def datos_validos():
     """Fixture con datos meteorológicos válidos"""
-    return {
-        "estacion_id": 3,
-        "temperatura": 22.5,
-        "humedad": 60.0,
-        "fecha": "2025-11-11T12:30:45.123456"
-    }
+    return dict(DATOS_VALIDOS)
+
+
+def cuerpo_mensaje(**campos):
+    """Cuerpo (bytes) de un mensaje válido, con `campos` reemplazados"""
+    return json.dumps({**DATOS_VALIDOS, **campos}).encode()
 
 
 @pytest.fixture
@@ -232,5 +241,1024 @@ class TestWithFixtures:
         assert not all(key in datos_invalidos_incompletos for key in required_keys)
 
 
+class TestDetectorAnomalias:
+    """Tests para el detector vectorizado de anomalías del Consumer"""
+
+    def test_lecturas_normales_sin_anomalias(self):
+        """Prueba que lecturas con ruido normal no se marcan"""
+        import numpy as np
+        from consumer_anomalias import DetectorAnomalias
+
+        rng = np.random.default_rng(0)
+        ids = rng.integers(1, 6, 200)
+        detector = DetectorAnomalias()
+        codigos = detector.evaluar(ids, rng.uniform(15, 35, 200), rng.uniform(40, 90, 200))
+        assert codigos.sum() == 0
+
+    def test_pico_detectado(self):
+        """Prueba que un salto brusco tras el calentamiento es un pico"""
+        import numpy as np
+        from consumer_anomalias import DetectorAnomalias, PICO
+
+        rng = np.random.default_rng(1)
+        temperaturas = rng.uniform(24, 26, 30)
+        temperaturas[25] = 60.0
+        detector = DetectorAnomalias()
+        codigos = detector.evaluar([2] * 30, temperaturas, rng.uniform(55, 65, 30))
+        assert codigos[25] & PICO
+        assert not (codigos[:25] & PICO).any()
+
+    def test_sensor_atascado_entre_lotes(self):
+        """Prueba que la racha de valores idénticos continúa entre lotes"""
+        from consumer_anomalias import DetectorAnomalias, ATASCADO
+
+        detector = DetectorAnomalias(repeticiones_atasco=5, lote_escalar=0)
+        primero = detector.evaluar([1, 1, 1], [20.0] * 3, [50.0, 51.0, 52.0])
+        segundo = detector.evaluar([1, 1], [20.0] * 2, [53.0, 54.0])
+        assert not (primero & ATASCADO).any()
+        assert segundo[1] & ATASCADO
+
+    def test_fuera_de_rango(self):
+        """Prueba que valores fuera de los CHECK de la BD se marcan"""
+        from consumer_anomalias import DetectorAnomalias, FUERA_RANGO, describir
+
+        detector = DetectorAnomalias()
+        codigos = detector.evaluar([1, 2], [25.0, 150.0], [60.0, 60.0])
+        assert codigos[0] == 0
+        assert describir(codigos[1]) == "fuera_rango"
+        assert codigos[1] == FUERA_RANGO
+
+    def test_ids_grandes_no_reservan_estado(self):
+        """Prueba que el estado se indexa por estaciones vistas, no por el valor del id"""
+        from consumer_anomalias import DetectorAnomalias
+
+        detector = DetectorAnomalias(lote_escalar=0)
+        detector.evaluar([2**31 - 1, 3, 2**31 - 1], [20.0, 21.0, 20.5], [50.0, 51.0, 50.5])
+        assert detector._conteo.shape[0] == 16
+        assert detector._conteo[detector._filas[2**31 - 1]] == 2
+
+    def test_vectorizado_igual_a_secuencial(self):
+        """Prueba que evaluar por lotes da lo mismo que lectura a lectura"""
+        import numpy as np
+        from consumer_anomalias import DetectorAnomalias
+
+        rng = np.random.default_rng(2)
+        n = 600
+        ids = rng.integers(1, 8, n)
+        temperaturas = np.round(rng.normal(25, 3, n), 1)
+        humedades = np.round(rng.normal(60, 4, n), 1)
+        temperaturas[rng.integers(0, n, 10)] = 80.0
+
+        por_lote = DetectorAnomalias()
+        codigos_lote = np.concatenate([
+            por_lote.evaluar(ids[i:i + 64], temperaturas[i:i + 64], humedades[i:i + 64])
+            for i in range(0, n, 64)
+        ])
+        secuencial = DetectorAnomalias()
+        codigos_secuencial = np.concatenate([
+            secuencial.evaluar(ids[i:i + 1], temperaturas[i:i + 1], humedades[i:i + 1])
+            for i in range(n)
+        ])
+        assert (codigos_lote == codigos_secuencial).all()
+        assert codigos_lote.any()
+
+
+    def test_camino_escalar_igual_a_vectorizado(self):
+        """Prueba que evaluar_lectura coincide con el camino NumPy (picos, planos, atascos)"""
+        import numpy as np
+        from consumer_anomalias import ATASCADO, PLANO, DetectorAnomalias
+
+        rng = np.random.default_rng(5)
+        n = 400
+        ids = rng.integers(1, 5, n)
+        temperaturas = np.round(rng.normal(25, 3, n), 1)
+        humedades = np.round(rng.normal(60, 4, n), 1)
+        temperaturas[ids == 2] = 21.5  # sensor atascado / plano
+        temperaturas[rng.integers(0, n, 8)] = 90.0
+
+        vectorizado = DetectorAnomalias()
+        codigos = np.concatenate([
+            vectorizado.evaluar(ids[i:i + 50], temperaturas[i:i + 50], humedades[i:i + 50])
+            for i in range(0, n, 50)
+        ])
+        escalar = DetectorAnomalias()
+        escalares = [
+            escalar.evaluar_lectura(int(e), float(t), float(h))
+            for e, t, h in zip(ids, temperaturas, humedades)
+        ]
+        assert codigos.tolist() == escalares
+        assert any(c & ATASCADO for c in escalares) and any(c & PLANO for c in escalares)
+        for estacion, fila in escalar._filas.items():
+            assert np.allclose(escalar._media[fila], vectorizado._media[vectorizado._filas[estacion]])
+
+    def test_lotes_pequenos_por_camino_escalar(self):
+        """Prueba que los lotes de hasta lote_escalar lecturas usan el camino escalar con el mismo resultado"""
+        import numpy as np
+        from consumer_anomalias import DetectorAnomalias, EtapaAnomalias
+        from consumer_lectura import Lectura
+
+        rng = np.random.default_rng(6)
+        n = 300
+        ids = rng.integers(1, 4, n)
+        temperaturas = np.round(rng.normal(25, 3, n), 1)
+        humedades = np.round(rng.normal(60, 4, n), 1)
+        temperaturas[rng.integers(0, n, 6)] = 90.0
+
+        escalar = DetectorAnomalias()
+        numpy_ = DetectorAnomalias(lote_escalar=0)
+        tamano = escalar.lote_escalar
+        with patch.object(escalar, "_evaluar_trozo") as trozo:
+            codigos = np.concatenate([
+                escalar.evaluar(ids[i:i + tamano], temperaturas[i:i + tamano], humedades[i:i + tamano])
+                for i in range(0, n, tamano)
+            ])
+        trozo.assert_not_called()
+        esperados = np.concatenate([
+            numpy_.evaluar(ids[i:i + tamano], temperaturas[i:i + tamano], humedades[i:i + tamano])
+            for i in range(0, n, tamano)
+        ])
+        assert (codigos == esperados).all() and codigos.any()
+
+        lecturas = [
+            Lectura(1, 25.0 + i * 0.1, 60.0 + i * 0.2, "2025-11-11T12:30:45")
+            for i in range(9)
+        ] + [Lectura(1, 150.0, 60.0, "2025-11-11T12:30:45")]
+        normales, anomalias = EtapaAnomalias()(lecturas)
+        assert normales == lecturas[:9]
+        assert anomalias == [(lecturas[9], "fuera_rango")]
+
+
+class TestLectura:
+    """Tests para el registro Lectura del Consumer"""
+
+    def test_lectura_sin_dict(self, datos_validos):
+        """Prueba que Lectura usa __slots__ y no tiene __dict__"""
+        from consumer_lectura import Lectura
+
+        lectura = Lectura.desde_dict(datos_validos)
+        assert not hasattr(lectura, "__dict__")
+        with pytest.raises(AttributeError):
+            lectura.otro_campo = 1
+
+    def test_como_fila_orden_columnas(self, datos_validos):
+        """Prueba que como_fila respeta el orden de weather_logs"""
+        from consumer_lectura import Lectura
+
+        lectura = Lectura.desde_dict(datos_validos)
+        assert lectura.como_fila() == (3, 22.5, 60.0, "2025-11-11T12:30:45.123456")
+
+
+class TestConsumerValidacionTipos:
+    """Tests para validar_mensaje del Consumer dividido"""
+
+    def test_mensaje_valido(self, datos_validos):
+        """Prueba que un mensaje completo y tipado es aceptado"""
+        from consumer_validacion import validar_mensaje
+
+        lectura, error = validar_mensaje(json.dumps(datos_validos))
+        assert error is None
+        assert lectura.como_dict() == datos_validos
+
+    def test_temperatura_no_numerica(self, datos_validos):
+        """Prueba que temperatura como texto es rechazada"""
+        from consumer_validacion import validar_mensaje
+
+        datos_validos["temperatura"] = "caliente"
+        data, error = validar_mensaje(json.dumps(datos_validos))
+        assert data is None
+        assert error == "tipos_invalidos"
+
+    def test_estacion_no_positiva(self, datos_validos):
+        """Prueba que estacion_id <= 0 es rechazada"""
+        from consumer_validacion import validar_mensaje
+
+        datos_validos["estacion_id"] = 0
+        _, error = validar_mensaje(json.dumps(datos_validos))
+        assert error == "tipos_invalidos"
+
+    def test_estacion_fuera_de_int4(self, datos_validos):
+        """Prueba que estacion_id mayor que el rango INT de PostgreSQL es rechazada"""
+        from consumer_validacion import validar_mensaje
+
+        datos_validos["estacion_id"] = 10_000_000_000
+        _, error = validar_mensaje(json.dumps(datos_validos))
+        assert error == "tipos_invalidos"
+
+    def test_valores_no_finitos(self, datos_validos):
+        """Prueba que NaN e Infinity (aceptados por json.loads) son rechazados"""
+        from consumer_validacion import validar_mensaje
+
+        for valor in (float("nan"), float("inf")):
+            datos_validos["temperatura"] = valor
+            _, error = validar_mensaje(json.dumps(datos_validos))
+            assert error == "tipos_invalidos"
+
+    def test_fecha_invalida(self, datos_validos):
+        """Prueba que una fecha que no es ISO 8601 es rechazada"""
+        from consumer_validacion import validar_mensaje
+
+        for fecha in ("ayer", 1731328245):
+            datos_validos["fecha"] = fecha
+            _, error = validar_mensaje(json.dumps(datos_validos))
+            assert error == "fecha_invalida"
+
+    def test_json_que_no_es_objeto(self):
+        """Prueba que un JSON válido que no es un objeto es rechazado sin excepción"""
+        from consumer_validacion import validar_mensaje
+
+        for body in (b"5", b"null", b"[1, 2]", b'"texto"'):
+            assert validar_mensaje(body) == (None, "no_es_objeto")
+
+    def test_utf8_invalido(self):
+        """Prueba que bytes que no son UTF-8 cuentan como error de JSON"""
+        from consumer_validacion import validar_mensaje
+
+        assert validar_mensaje(b'{"estacion_id": "\xff"}') == (None, "json_error")
+
+
+class TestPipeline:
+    """Tests para el núcleo compartido del Consumer (sin broker ni BD)"""
+
+    def test_lote_completo_ack_multiple(self):
+        """Prueba que al completar el lote se escribe y se confirma con multiple"""
+        from consumer_core import Pipeline
+
+        escritos = []
+        pipeline = Pipeline(
+            sumidero=lambda lecturas, anomalias, resumenes: escritos.append(lecturas) or True,
+            tamano_lote=3,
+        )
+        canal = Mock()
+        for tag in (1, 2, 3):
+            pipeline.recibir(canal, tag, cuerpo_mensaje())
+
+        assert len(escritos) == 1 and len(escritos[0]) == 3
+        canal.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+        assert pipeline.metrics["db_ok"] == 3
+
+    def test_mensaje_invalido_nack_inmediato(self):
+        """Prueba que un JSON inválido se rechaza sin entrar al lote"""
+        from consumer_core import Pipeline
+
+        pipeline = Pipeline(sumidero=lambda l, a, r: True, tamano_lote=10)
+        canal = Mock()
+        pipeline.recibir(canal, 7, b"{no es json")
+
+        canal.basic_nack.assert_called_once_with(delivery_tag=7, requeue=False)
+        assert pipeline.lote_tags == []
+        assert pipeline.metrics["json_errors"] == 1
+
+    def test_fallo_sumidero_nack_lote(self):
+        """Prueba que si el sumidero falla se rechaza el lote completo"""
+        from consumer_core import Pipeline
+
+        pipeline = Pipeline(sumidero=lambda l, a, r: False, tamano_lote=2)
+        canal = Mock()
+        pipeline.recibir(canal, 1, cuerpo_mensaje())
+        pipeline.recibir(canal, 2, cuerpo_mensaje())
+
+        canal.basic_nack.assert_called_once_with(delivery_tag=2, multiple=True, requeue=False)
+        assert pipeline.metrics["db_errors"] == 2
+
+    def test_etapa_desvia_anomalias(self):
+        """Prueba que la etapa de anomalías desvía lecturas al sumidero"""
+        from consumer_anomalias import EtapaAnomalias
+        from consumer_core import Pipeline
+
+        recibido = {}
+
+        def sumidero(lecturas, anomalias, resumenes):
+            recibido["normales"] = lecturas
+            recibido["anomalias"] = anomalias
+            return True
+
+        pipeline = Pipeline(sumidero=sumidero, etapas=[EtapaAnomalias()], tamano_lote=2)
+        canal = Mock()
+        pipeline.recibir(canal, 1, cuerpo_mensaje(temperatura=25.0))
+        pipeline.recibir(canal, 2, cuerpo_mensaje(estacion_id=2, temperatura=150.0))
+
+        assert len(recibido["normales"]) == 1
+        lectura, motivo = recibido["anomalias"][0]
+        assert lectura.estacion_id == 2 and motivo == "fuera_rango"
+
+
+class TestCompresion:
+    """Tests para la compresión de payloads Producer -> Consumer"""
+
+    CUERPO = json.dumps({
+        "estacion_id": 2,
+        "temperatura": 21.5,
+        "humedad": 55.13,
+        "fecha": "2026-10-19T10:00:00.000001",
+    }).encode()
+
+    def test_diccionarios_identicos(self):
+        """Prueba que producer y consumer comparten el mismo diccionario"""
+        import consumer_compresion
+        import producer_compresion
+
+        assert producer_compresion.DICCIONARIO_V1 == consumer_compresion.DICCIONARIO_V1
+        assert producer_compresion.ENCODING_ZLIB == consumer_compresion.ENCODING_ZLIB
+        assert producer_compresion.ENCODING_ZSTD == consumer_compresion.ENCODING_ZSTD
+
+    def test_ida_y_vuelta_zlib(self):
+        """Prueba que zlib con diccionario comprime y se recupera igual"""
+        from consumer_compresion import descomprimir
+        from producer_compresion import comprimir
+
+        body, encoding = comprimir(self.CUERPO, "zlib", 64)
+        assert encoding == "zlib-dict-v1"
+        assert len(body) < len(self.CUERPO) / 2
+        assert descomprimir(body, encoding) == self.CUERPO
+
+    def test_ida_y_vuelta_zstd(self):
+        """Prueba zstd con diccionario (si zstandard está instalado)"""
+        pytest.importorskip("zstandard")
+        from consumer_compresion import descomprimir
+        from producer_compresion import comprimir
+
+        body, encoding = comprimir(self.CUERPO, "zstd", 64)
+        assert encoding == "zstd-dict-v1"
+        assert descomprimir(body, encoding) == self.CUERPO
+
+    def test_mensaje_pequeno_sin_comprimir(self):
+        """Prueba que mensajes bajo el umbral no se comprimen"""
+        from producer_compresion import comprimir
+
+        assert comprimir(self.CUERPO, "zlib", 1024) == (self.CUERPO, None)
+        assert comprimir(self.CUERPO, "none", 0) == (self.CUERPO, None)
+
+    def test_pipeline_descomprime(self):
+        """Prueba que el pipeline descomprime según content_encoding"""
+        from consumer_core import Pipeline
+        from producer_compresion import comprimir
+
+        escritos = []
+        pipeline = Pipeline(sumidero=lambda l, a, r: escritos.extend(l) or True)
+        body, encoding = comprimir(self.CUERPO, "zlib", 0)
+        canal = Mock()
+        pipeline.recibir(canal, 1, body, encoding)
+
+        assert escritos[0].humedad == 55.13
+        canal.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+    def test_codificacion_desconocida_nack(self):
+        """Prueba que un content_encoding desconocido va a la DLX"""
+        from consumer_core import Pipeline
+
+        pipeline = Pipeline(sumidero=lambda l, a, r: True)
+        canal = Mock()
+        pipeline.recibir(canal, 4, b"basura", "brotli")
+
+        canal.basic_nack.assert_called_once_with(delivery_tag=4, requeue=False)
+        assert pipeline.metrics["json_errors"] == 1
+
+    def test_cuerpo_raro_no_arrastra_el_lote(self):
+        """Prueba que un cuerpo descomprimido que no es objeto o no es UTF-8 se rechaza solo"""
+        import zlib
+        from consumer_core import Pipeline
+        from consumer_compresion import DICCIONARIO_V1, ENCODING_ZLIB
+        from producer_compresion import comprimir
+
+        escritos = []
+        pipeline = Pipeline(sumidero=lambda l, a, r: escritos.extend(l) or True, tamano_lote=3)
+        canal = Mock()
+        pipeline.recibir(canal, 1, self.CUERPO)
+        pipeline.recibir(canal, 2, *comprimir(b"null", "zlib", 0))
+        compresor = zlib.compressobj(wbits=-15, zdict=DICCIONARIO_V1)
+        pipeline.recibir(canal, 3, compresor.compress(b"\xff\xfe") + compresor.flush(), ENCODING_ZLIB)
+        pipeline.recibir(canal, 4, self.CUERPO)
+        pipeline.recibir(canal, 5, self.CUERPO)
+
+        assert canal.basic_nack.call_args_list == [
+            ((), {"delivery_tag": 2, "requeue": False}),
+            ((), {"delivery_tag": 3, "requeue": False}),
+        ]
+        canal.basic_ack.assert_called_once_with(delivery_tag=5, multiple=True)
+        assert len(escritos) == 3
+        assert pipeline.metrics["json_errors"] == 2
+
+
+class TestReplay:
+    """Tests para la herramienta de reproducción de tráfico"""
+
+    def test_linea_lectura_suelta(self, datos_validos):
+        """Prueba que una lectura del producer se convierte en registro"""
+        from producer_replay import registro_desde_linea
+
+        registro = registro_desde_linea(json.dumps(datos_validos))
+        assert registro["routing_key"] == "station.3"
+        assert json.loads(registro["body"]) == datos_validos
+        assert registro["ts"] is not None
+
+    def test_grabado_ida_y_vuelta_comprimido(self):
+        """Prueba que un registro comprimido sobrevive a grabar y leer"""
+        from producer_replay import linea_desde_registro, registro_desde_linea
+
+        registro = {
+            "ts": 1700000000.5,
+            "routing_key": "station.2",
+            "body": b"\x00\xffbinario",
+            "content_encoding": "zlib-dict-v1",
+        }
+        assert registro_desde_linea(linea_desde_registro(registro)) == registro
+
+    def test_mensaje_grabado_con_subsegundo(self, datos_validos):
+        """Prueba que el tiempo de un mensaje grabado no se trunca al segundo"""
+        from datetime import datetime
+        from producer_replay import registro_desde_mensaje
+
+        method = Mock(routing_key="station.3", delivery_tag=1)
+        body = json.dumps(datos_validos).encode()
+
+        con_cabecera = Mock(headers={"ts": 1700000000.25}, timestamp=1700000000,
+                            content_encoding="zlib-dict-v1")
+        assert registro_desde_mensaje(method, con_cabecera, b"x")["ts"] == 1700000000.25
+
+        sin_cabecera = Mock(headers=None, timestamp=1700000000, content_encoding=None)
+        esperado = datetime.fromisoformat(datos_validos["fecha"]).timestamp()
+        assert registro_desde_mensaje(method, sin_cabecera, body)["ts"] == esperado
+
+        comprimido = Mock(headers=None, timestamp=1700000000, content_encoding="zlib-dict-v1")
+        assert registro_desde_mensaje(method, comprimido, b"x")["ts"] == 1700000000
+
+    def test_leer_jsonl_perezoso(self, tmp_path, datos_validos):
+        """Prueba que leer_jsonl es un generador e ignora líneas inválidas"""
+        import types
+        from producer_replay import leer_jsonl
+
+        ruta = tmp_path / "captura.jsonl"
+        ruta.write_text(json.dumps(datos_validos) + "\n{roto\n\n")
+        registros = leer_jsonl(str(ruta))
+        assert isinstance(registros, types.GeneratorType)
+        assert len(list(registros)) == 1
+
+    def test_reproducir_respeta_tiempos_escalados(self):
+        """Prueba que los intervalos originales se dividen por la velocidad"""
+        from producer_replay import reproducir
+
+        registros = [
+            {"ts": 100.0 + i * 10, "routing_key": "station.1", "body": b"{}",
+             "content_encoding": None}
+            for i in range(3)
+        ]
+        # Reloj simulado: connection.sleep avanza el reloj que lee perf_counter
+        reloj = [0.0]
+        esperas = []
+
+        def dormir(segundos):
+            esperas.append(segundos)
+            reloj[0] += segundos
+
+        canal = Mock()
+        canal.connection.sleep.side_effect = dormir
+        with patch("producer_replay.time.sleep") as sleep, \
+                patch("producer_replay.time.perf_counter", side_effect=lambda: reloj[0]):
+            stats = reproducir(registros, canal, velocidad=10.0)
+
+        # time.sleep bloquearía los heartbeats de la BlockingConnection
+        sleep.assert_not_called()
+
+        assert esperas == [pytest.approx(1.0), pytest.approx(1.0)]
+        assert stats["publicados"] == 3
+        assert canal.basic_publish.call_count == 3
+
+    def test_reproducir_max_sin_esperas(self):
+        """Prueba que velocidad 'max' no duerme y confirma cada publicación"""
+        from producer_replay import parse_velocidad, reproducir
+
+        registros = [
+            {"ts": 100.0 + i, "routing_key": "station.1", "body": b"{}",
+             "content_encoding": None, "delivery_tag": i}
+            for i in range(5)
+        ]
+        publicados = []
+        canal = Mock()
+        reproducir(registros, canal, velocidad=parse_velocidad("max"),
+                   al_publicar=lambda r: publicados.append(r["delivery_tag"]))
+
+        canal.connection.sleep.assert_not_called()
+        assert publicados == [0, 1, 2, 3, 4]
+
+
+class TestArranqueRapido:
+    """Tests para el modo FAST_START del Consumer"""
+
+    def test_topologia_existente_no_se_redeclara(self):
+        """Prueba que con fast_start y topología existente solo hay pasivas"""
+        from consumer_core import preparar_canal
+
+        connection = Mock()
+        channel = connection.channel.return_value
+        preparar_canal(connection, "logs_queue", fast_start=True)
+
+        channel.exchange_declare.assert_not_called()
+        assert all(c.kwargs.get("passive") for c in channel.queue_declare.call_args_list)
+        # Los bindings se reaplican siempre (idempotentes)
+        rutas = {c.kwargs["routing_key"] for c in channel.queue_bind.call_args_list}
+        assert rutas == {"station.*", "station.*.critical"}
+
+    def test_topologia_faltante_se_declara(self):
+        """Prueba que un 404 en la comprobación pasiva declara todo en otro canal"""
+        from pika.exceptions import ChannelClosedByBroker
+        from consumer_core import preparar_canal
+
+        verificacion, nuevo = Mock(), Mock()
+        verificacion.queue_declare.side_effect = ChannelClosedByBroker(404, "NOT_FOUND")
+        connection = Mock()
+        connection.channel.side_effect = [verificacion, nuevo]
+
+        assert preparar_canal(connection, "logs_queue", fast_start=True) is nuevo
+        assert nuevo.exchange_declare.call_count == 2
+        assert nuevo.queue_bind.call_count == 3
+
+    def test_sin_fast_start_declara_todo(self):
+        """Prueba que sin fast_start se declara la topología completa"""
+        from consumer_core import preparar_canal
+
+        connection = Mock()
+        channel = preparar_canal(connection, "logs_queue")
+        assert channel.exchange_declare.call_count == 2
+        assert not any(c.kwargs.get("passive") for c in channel.queue_declare.call_args_list)
+
+    def test_tiempo_hasta_primer_mensaje(self):
+        """Prueba que el primer mensaje registra time_to_first_message"""
+        import time as _time
+        from consumer_core import Pipeline
+
+        pipeline = Pipeline(sumidero=lambda l, a, r: True, t_arranque=_time.time() - 2.0)
+        assert pipeline.metrics["time_to_first_message"] is None
+        pipeline.recibir(Mock(), 1, b"{}")
+        primero = pipeline.metrics["time_to_first_message"]
+        pipeline.recibir(Mock(), 2, b"{}")
+
+        assert primero >= 2.0
+        assert pipeline.metrics["time_to_first_message"] == primero
+
+
+class TestLimitador:
+    """Tests para el límite por estación y el carril prioritario"""
+
+    def test_token_bucket_rafaga_y_recarga(self):
+        """Prueba que se permite la ráfaga y luego se recarga a la tasa"""
+        from consumer_limites import LimitadorEstaciones
+
+        limitador = LimitadorEstaciones(tasa=2, rafaga=3)
+        assert [limitador.permitir(1, 0.0) for _ in range(4)] == [True, True, True, False]
+        # Otra estación tiene su propio cubo
+        assert limitador.permitir(2, 0.0)
+        # 0.5 s a 2 msg/s = 1 token
+        assert limitador.permitir(1, 0.5)
+        assert not limitador.permitir(1, 0.5)
+
+    def test_agregador_por_minuto(self):
+        """Prueba que el exceso se resume por estación y minuto"""
+        from datetime import datetime
+        from consumer_lectura import Lectura
+        from consumer_limites import AgregadorExceso
+
+        agregador = AgregadorExceso()
+        agregador.agregar(Lectura(1, 20.0, 50.0, "2025-11-11T12:30:05"))
+        agregador.agregar(Lectura(1, 22.0, 54.0, "2025-11-11T12:30:55"))
+        agregador.agregar(Lectura(1, 10.0, 10.0, "2025-11-11T12:31:00"))
+        assert not agregador.agregar(Lectura(1, 10.0, 10.0, "ayer"))
+
+        filas = sorted(agregador.extraer())
+        assert filas[0] == (1, datetime(2025, 11, 11, 12, 30), 2, 42.0, 104.0)
+        assert filas[1][2] == 1
+        assert len(agregador) == 0
+
+    def test_pipeline_resume_exceso(self):
+        """Prueba que el exceso va al sumidero como resumen y se confirma"""
+        from consumer_core import Pipeline
+        from consumer_limites import LimitadorEstaciones
+
+        recibido = {}
+
+        def sumidero(lecturas, anomalias, resumenes):
+            recibido["lecturas"] = lecturas
+            recibido["resumenes"] = resumenes
+            return True
+
+        pipeline = Pipeline(
+            sumidero=sumidero, tamano_lote=3,
+            limitador=LimitadorEstaciones(tasa=0.001, rafaga=1),
+        )
+        canal = Mock()
+        for tag in (1, 2, 3):
+            pipeline.recibir(canal, tag, cuerpo_mensaje(estacion_id=1))
+
+        assert len(recibido["lecturas"]) == 1
+        assert recibido["resumenes"][0][2] == 2
+        canal.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+        assert pipeline.metrics["throttled"] == 2
+        assert pipeline.metrics["throttled_by_station"] == {1: 2}
+
+    def test_pipeline_descarta_exceso(self):
+        """Prueba que en modo shed el exceso se confirma sin escribirse"""
+        from consumer_core import Pipeline
+        from consumer_limites import LimitadorEstaciones
+
+        recibido = {}
+        pipeline = Pipeline(
+            sumidero=lambda l, a, r: recibido.update(lecturas=l, resumenes=r) or True,
+            tamano_lote=2,
+            limitador=LimitadorEstaciones(tasa=0.001, rafaga=1),
+            modo_exceso="shed",
+        )
+        canal = Mock()
+        pipeline.recibir(canal, 1, cuerpo_mensaje(estacion_id=1))
+        pipeline.recibir(canal, 2, cuerpo_mensaje(estacion_id=1))
+
+        assert len(recibido["lecturas"]) == 1 and recibido["resumenes"] == []
+        canal.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+        assert pipeline.metrics["shed_by_station"] == {1: 1}
+
+    def test_modo_exceso_desconocido(self):
+        """Prueba que un modo de exceso inválido se rechaza al construir"""
+        from consumer_core import Pipeline
+
+        with pytest.raises(ValueError):
+            Pipeline(sumidero=lambda l, a, r: True, modo_exceso="ignorar")
+
+    def test_ruta_estacion_critica(self):
+        """Prueba que las estaciones críticas se publican en el carril prioritario"""
+        import producer
+
+        with patch.object(producer, "CRITICAL_STATIONS", frozenset({3})):
+            assert producer.ruta_estacion(3) == "station.3.critical"
+            assert producer.ruta_estacion(1) == "station.1"
+
+    def test_carriles_con_prioridad(self):
+        """Prueba que el carril prioritario se enlaza a station.*.critical"""
+        from consumer_core import carriles, topologia
+
+        general, prioritario = Mock(), Mock()
+        lanes = carriles(general, "logs_queue", (prioritario, "logs_queue_priority"))
+        assert lanes[1] == (prioritario, "logs_queue_priority", ("station.*.critical",))
+
+        pasos = topologia("logs_queue_priority", lanes[1][2])
+        assert [k["routing_key"] for m, k in pasos if m == "queue_bind" and k["queue"] != "logs_dlx"] \
+            == ["station.*.critical"]
+        # La cola general deja de recibir las críticas para no duplicarlas
+        pasos = topologia("logs_queue", lanes[0][2])
+        assert ("queue_unbind", {"queue": "logs_queue", "exchange": "weather.data",
+                                 "routing_key": "station.*.critical"}) in pasos
+
+    def test_sin_carril_prioritario_general_recibe_criticas(self):
+        """Prueba que sin PRIORITY_LANE la cola general se enlaza también a station.*.critical"""
+        from consumer_core import carriles, topologia
+
+        (_, cola, rutas), = carriles(Mock(), "logs_queue")
+        enlaces = {k["routing_key"] for m, k in topologia(cola, rutas)
+                   if m == "queue_bind" and k["queue"] == cola}
+        assert enlaces == {"station.*", "station.*.critical"}
+        assert not any(m == "queue_unbind" for m, _ in topologia(cola, rutas))
+
+
+class TestSentenciasPreparadas:
+    """Tests para el sumidero de sentencias preparadas (sin BD)"""
+
+    def _lectura(self):
+        from consumer_lectura import Lectura
+        return Lectura(1, 20.0, 50.0, "2025-11-11T12:30:45")
+
+    def _conexion(self):
+        conn = Mock()
+        conn.cursor.return_value.connection = conn
+        return conn
+
+    def _sentencias(self, conn):
+        """Nombres preparados y DEALLOCATE, en orden."""
+        sentencias = []
+        for c in conn.cursor.return_value.execute.call_args_list:
+            sql = c.args[0].split()
+            if sql[0] == "PREPARE":
+                sentencias.append(sql[1])
+            elif sql[0] == "DEALLOCATE":
+                sentencias.append("DEALLOCATE")
+        return sentencias
+
+    def _aislado(self):
+        import consumer_bd
+        return patch.multiple(consumer_bd, conexion_preparada=None, sentencias_preparadas=set())
+
+    def test_prepara_solo_lo_que_usa(self):
+        """Prueba que cada sentencia se prepara la primera vez que se usa y solo entonces"""
+        import consumer_bd
+
+        conn = self._conexion()
+        with patch.object(consumer_bd, "validar_conexion", return_value=conn), \
+                self._aislado(), \
+                patch("psycopg2.extras.execute_batch") as execute_batch:
+            assert consumer_bd.insertar_preparado([self._lectura()], [])
+            assert consumer_bd.insertar_preparado([self._lectura()], [])
+            # Solo weather_logs hasta aquí (consumer.py)
+            assert self._sentencias(conn) == ["DEALLOCATE", "insertar_lectura"]
+            assert consumer_bd.insertar_preparado([self._lectura()], [], [(1, "2025-11-11T12:30:00", 1, 20.0, 50.0)])
+
+        assert self._sentencias(conn) == ["DEALLOCATE", "insertar_lectura", "upsert_resumen"]
+        sentencias = [c.args[1] for c in execute_batch.call_args_list]
+        assert sentencias == [
+            consumer_bd.SQL_EXECUTE_LECTURA,
+            consumer_bd.SQL_EXECUTE_LECTURA,
+            consumer_bd.SQL_EXECUTE_LECTURA,
+            consumer_bd.SQL_EXECUTE_RESUMEN,
+        ]
+
+    def test_reconexion_vuelve_a_preparar(self):
+        """Prueba que una conexión nueva vuelve a preparar las sentencias"""
+        import consumer_bd
+
+        vieja, nueva = self._conexion(), self._conexion()
+        with patch.object(consumer_bd, "validar_conexion", side_effect=[vieja, nueva]), \
+                self._aislado(), \
+                patch("psycopg2.extras.execute_batch"):
+            consumer_bd.insertar_preparado([self._lectura()], [])
+            consumer_bd.insertar_preparado([self._lectura()], [])
+
+        assert self._sentencias(nueva) == ["DEALLOCATE", "insertar_lectura"]
+
+    def test_fallo_desaloja_antes_de_preparar(self):
+        """Prueba que tras un fallo parcial la misma conexión hace DEALLOCATE ALL antes de volver a preparar"""
+        import consumer_bd
+
+        conn = self._conexion()
+        with patch.object(consumer_bd, "validar_conexion", return_value=conn), \
+                self._aislado(), \
+                patch("psycopg2.extras.execute_batch", side_effect=[Exception("sin tabla"), None]):
+            assert consumer_bd.insertar_preparado([self._lectura()], []) is False
+            assert consumer_bd.conexion_preparada is None
+            assert consumer_bd.insertar_preparado([self._lectura()], [])
+
+        conn.rollback.assert_called_once()
+        assert self._sentencias(conn) == [
+            "DEALLOCATE", "insertar_lectura", "DEALLOCATE", "insertar_lectura",
+        ]
+
+
+class TestDrenado:
+    """Tests para el cierre ordenado (SIGTERM) de consumer y producer"""
+
+    def test_drenar_escribe_y_confirma(self):
+        """Prueba que el lote pendiente se escribe y se confirma al drenar"""
+        import time as _time
+        from consumer_core import Pipeline
+
+        escritos = []
+        pipeline = Pipeline(sumidero=lambda l, a, r, plazo=None: escritos.extend(l) or True, tamano_lote=10)
+        canal = Mock()
+        pipeline.recibir(canal, 1, cuerpo_mensaje())
+        pipeline.recibir(canal, 2, cuerpo_mensaje())
+
+        assert pipeline.drenar(canal, _time.monotonic() + 5) == (2, 2, 0)
+        assert len(escritos) == 2
+        canal.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+
+    def test_drenar_fallo_reencola(self):
+        """Prueba que si la escritura falla al drenar el lote vuelve a la cola"""
+        import time as _time
+        from consumer_core import Pipeline
+
+        pipeline = Pipeline(sumidero=lambda l, a, r, plazo=None: False, tamano_lote=10)
+        canal = Mock()
+        pipeline.recibir(canal, 1, cuerpo_mensaje())
+
+        assert pipeline.drenar(canal, _time.monotonic() + 5) == (1, 0, 1)
+        canal.basic_nack.assert_called_once_with(delivery_tag=1, multiple=True, requeue=True)
+
+    def test_drenar_plazo_vencido(self):
+        """Prueba que con el plazo vencido no se escribe y se reencola"""
+        import time as _time
+        from consumer_core import Pipeline
+
+        sumidero = Mock(return_value=True)
+        pipeline = Pipeline(sumidero=sumidero, tamano_lote=10)
+        canal = Mock()
+        pipeline.recibir(canal, 1, cuerpo_mensaje())
+        pipeline.recibir(canal, 2, cuerpo_mensaje())
+
+        assert pipeline.drenar(canal, _time.monotonic() - 1) == (2, 0, 2)
+        sumidero.assert_not_called()
+        canal.basic_nack.assert_called_once_with(delivery_tag=2, multiple=True, requeue=True)
+        assert pipeline.lote_tags == []
+
+    def test_entrega_tardia_se_reencola(self):
+        """Prueba que un mensaje recibido durante el drenado vuelve a la cola"""
+        from consumer_core import Pipeline
+
+        pipeline = Pipeline(sumidero=lambda l, a, r: True)
+        pipeline.drenando = True
+        canal = Mock()
+        pipeline.recibir(canal, 9, cuerpo_mensaje())
+
+        canal.basic_nack.assert_called_once_with(delivery_tag=9, requeue=True)
+        assert pipeline.metrics["requeued"] == 1
+        assert pipeline.metrics["messages_received"] == 0
+
+    def test_fuente_bloqueante_drena_y_cierra(self):
+        """Prueba que con parada la fuente bloqueante cancela, drena y cierra sin reintentar"""
+        import threading
+        from consumer_core import Pipeline, consumir_bloqueante
+
+        temporizadores = []
+        connection = Mock()
+        connection.call_later.side_effect = lambda _t, f: temporizadores.append(f)
+        channel = connection.channel.return_value
+        pipeline = Pipeline(sumidero=lambda l, a, r, plazo=None: True, tamano_lote=10)
+        parada = threading.Event()
+
+        def start_consuming():
+            pipeline.recibir(channel, 1, cuerpo_mensaje())
+            parada.set()
+            temporizadores[0]()
+
+        channel.start_consuming.side_effect = start_consuming
+        with patch("pika.BlockingConnection", return_value=connection) as conexion:
+            consumir_bloqueante(pipeline, "rabbitmq", "logs_queue", parada=parada)
+
+        channel.stop_consuming.assert_called_once()
+        channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+        channel.close.assert_called_once()
+        connection.close.assert_called_once()
+        assert conexion.call_count == 1
+
+    def test_esperar_dependencias_atiende_parada(self):
+        """Prueba que la espera a dependencias pendientes termina al activar parada"""
+        import threading
+        from concurrent.futures import Future
+        from consumer_core import esperar_dependencias
+
+        parada = threading.Event()
+        parada.set()
+        assert esperar_dependencias([Future()], parada, intervalo=0.01) is False
+
+        lista = Future()
+        lista.set_result(None)
+        assert esperar_dependencias([lista], threading.Event()) is True
+
+    def test_conectar_postgres_deja_de_reintentar(self):
+        """Prueba que conectar_postgres abandona los reintentos con parada activada"""
+        import threading
+        import consumer_bd
+
+        parada = threading.Event()
+        parada.set()
+        with patch.object(consumer_bd, "parada_conexion", None), \
+                patch("psycopg2.connect", side_effect=Exception("sin servidor")) as connect:
+            assert consumer_bd.conectar_postgres(parada) is None
+        assert connect.call_count == 1
+
+    def test_caida_bd_con_parada_reencola(self):
+        """Prueba que un lote que falla por la parada durante una caída de PostgreSQL vuelve a la cola"""
+        import threading
+        import consumer_bd
+        from consumer_core import Pipeline
+
+        parada = threading.Event()
+
+        def connect(**_kw):
+            parada.set()
+            raise Exception("sin servidor")
+
+        pipeline = Pipeline(sumidero=consumer_bd.insertar_lote, tamano_lote=2)
+        pipeline.parada = parada
+        canal = Mock()
+        with patch.object(consumer_bd, "db_connection", None), \
+                patch.object(consumer_bd, "parada_conexion", parada), \
+                patch("psycopg2.connect", side_effect=connect):
+            pipeline.recibir(canal, 1, cuerpo_mensaje())
+            pipeline.recibir(canal, 2, cuerpo_mensaje())
+
+        canal.basic_nack.assert_called_once_with(delivery_tag=2, multiple=True, requeue=True)
+        assert pipeline.metrics["requeued"] == 2
+
+    def test_sumidero_respeta_plazo(self):
+        """Prueba que al drenar el sumidero limita sus sentencias al tiempo restante"""
+        import time as _time
+        import consumer_bd
+        from consumer_lectura import Lectura
+
+        conn = MagicMock(closed=False)
+        cursor = conn.cursor.return_value
+        lectura = Lectura(1, 20.0, 50.0, "2025-11-11T12:30:45")
+        with patch.object(consumer_bd, "db_connection", conn), \
+                patch("psycopg2.extras.execute_values"):
+            assert consumer_bd.insertar_lote([lectura], [], plazo=_time.monotonic() + 3)
+
+        sql, (ms,) = cursor.execute.call_args_list[0].args
+        assert sql == consumer_bd.SQL_STATEMENT_TIMEOUT
+        assert 0 < ms <= 3000
+        conn.commit.assert_called_once()
+
+    def test_reconexion_respeta_plazo(self):
+        """Prueba que al drenar la reconexión hace un intento acotado o ninguno"""
+        import time as _time
+        import consumer_bd
+
+        with patch.object(consumer_bd, "db_connection", None), \
+                patch("psycopg2.connect", side_effect=Exception("sin servidor")) as connect:
+            assert consumer_bd.insertar_lote([], [], plazo=_time.monotonic() + 3.5) is False
+            assert connect.call_count == 1
+            assert connect.call_args.kwargs["connect_timeout"] == 3
+
+            assert consumer_bd.insertar_lote([], [], plazo=_time.monotonic() + 1) is False
+            assert connect.call_count == 1
+
+    def test_fuente_bloqueante_parada_esperando_bd(self):
+        """Prueba que con parada durante la espera a PostgreSQL no se empieza a consumir"""
+        import threading
+        from concurrent.futures import Future
+        from consumer_core import Pipeline, consumir_bloqueante
+
+        connection = Mock()
+        channel = connection.channel.return_value
+        pipeline = Pipeline(sumidero=lambda l, a, r: True, tamano_lote=10)
+        parada = threading.Event()
+        parada.set()
+
+        with patch("pika.BlockingConnection", return_value=connection) as conexion:
+            consumir_bloqueante(pipeline, "rabbitmq", "logs_queue",
+                                dependencias=[Future()], parada=parada)
+
+        channel.basic_consume.assert_not_called()
+        channel.start_consuming.assert_not_called()
+        connection.close.assert_called_once()
+        assert conexion.call_count == 1
+
+    def test_producer_cierra_canal_al_parar(self):
+        """Prueba que el producer termina el mensaje en curso y cierra canal y conexión"""
+        import threading
+        import producer
+
+        connection = Mock()
+        channel = connection.channel.return_value
+        parada = threading.Event()
+        channel.basic_publish.side_effect = lambda **_kw: parada.set()
+
+        with patch.object(producer, "parada", parada), \
+                patch.object(producer.pika, "BlockingConnection", return_value=connection), \
+                patch.dict(producer.metrics, {"messages_sent": 0}):
+            producer.publicar_datos()
+            assert producer.metrics["messages_sent"] == 1
+
+        channel.close.assert_called_once()
+        connection.close.assert_called_once()
+
+
+class TestImagenes:
+    """Tests para los Dockerfile: cada imagen incluye los módulos que importa"""
+
+    RAIZ = os.path.join(os.path.dirname(__file__), '..')
+
+    def _copiados(self, servicio):
+        directorio = os.path.join(self.RAIZ, servicio)
+        copiados = set()
+        with open(os.path.join(directorio, "Dockerfile"), encoding="utf-8") as f:
+            for linea in f:
+                partes = linea.split()
+                if partes[:1] != ["COPY"]:
+                    continue
+                for origen in partes[1:-1]:
+                    if origen == ".":
+                        copiados.update(os.listdir(directorio))
+                    else:
+                        copiados.add(origen)
+        return copiados
+
+    def _imports_locales(self, servicio, modulo, vistos=None):
+        import ast
+
+        directorio = os.path.join(self.RAIZ, servicio)
+        vistos = set() if vistos is None else vistos
+        vistos.add(modulo)
+        with open(os.path.join(directorio, modulo + ".py"), encoding="utf-8") as f:
+            arbol = ast.parse(f.read())
+        for nodo in ast.walk(arbol):
+            if isinstance(nodo, ast.Import):
+                nombres = [alias.name for alias in nodo.names]
+            elif isinstance(nodo, ast.ImportFrom) and nodo.module:
+                nombres = [nodo.module]
+            else:
+                continue
+            for nombre in nombres:
+                local = os.path.exists(os.path.join(directorio, nombre + ".py"))
+                if local and nombre not in vistos:
+                    self._imports_locales(servicio, nombre, vistos)
+        return vistos
+
+    @pytest.mark.parametrize("servicio,entrada", [
+        ("producer", "producer"),
+        ("producer", "producer_replay"),
+        ("consumer", "consumer_main"),
+        ("consumer", "consumer"),
+    ])
+    def test_imagen_incluye_modulos(self, servicio, entrada):
+        """Prueba que el Dockerfile copia la entrada y todos sus imports locales"""
+        copiados = self._copiados(servicio)
+        faltan = {m + ".py" for m in self._imports_locales(servicio, entrada)} - copiados
+        assert not faltan
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
@@ -92,6 +92,19 @@ if command -v docker >/dev/null 2>&1; then
     else
         error "Docker Compose NO válido"
     fi
+
+    # La imagen debe arrancar: el módulo de entrada y sus imports locales
+    # tienen que estar copiados (sin conectar a RabbitMQ ni a PostgreSQL)
+    for entrada in "producer:producer" "producer:producer_replay" "consumer:consumer_main" "consumer:consumer"; do
+        servicio="${entrada%%:*}"
+        modulo="${entrada##*:}"
+        if docker compose build -q "$servicio" >/dev/null 2>&1 && \
+           docker compose run --rm --no-deps "$servicio" python -c "import $modulo" >/dev/null 2>&1; then
+            success "Imagen $servicio: import $modulo"
+        else
+            error "Imagen $servicio: falla import $modulo"
+        fi
+    done
 else
     warning "Docker no está disponible"
 fi
@@ -200,10 +213,10 @@ else
 fi
 
 # Consumer debe tener pool de conexiones
-if grep -q "db_connection" consumer/consumer.py; then
-    success "consumer.py - Manejo de conexiones presente"
+if grep -q "db_connection" consumer/consumer_bd.py; then
+    success "consumer_bd.py - Manejo de conexiones presente"
 else
-    error "consumer.py - Manejo de conexiones NO encontrado"
+    error "consumer_bd.py - Manejo de conexiones NO encontrado"
 fi
 
 # Consumer debe tener logging